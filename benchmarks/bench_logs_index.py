@@ -0,0 +1,51 @@
+"""
+Memory benchmark of the log de-duplication index.
+
+Feeds millions of log numbers (with replays, reordering and lost lines) to LogsIndex
+and prints the traced memory and the process RSS every million messages.
+
+    python -m benchmarks.bench_logs_index [millions]
+"""
+import random
+import resource
+import sys
+import time
+import tracemalloc
+
+from fz_manager.dispatch import LogsIndex
+
+
+def rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def log_numbers(total: int):
+    rnd = random.Random(42)
+    num = 0
+    while num < total:
+        batch = list(range(num, num + 64))
+        rnd.shuffle(batch)
+        for n in batch:
+            if rnd.random() < 0.001:
+                continue  # lost line, never delivered
+            yield n
+        yield from range(num, num + 16)  # replayed after a reconnect
+        num += 64
+
+
+def main(millions: int = 5):
+    index = LogsIndex()
+    tracemalloc.start()
+    start = time.perf_counter()
+    print(f'{"messages":>10} {"traced MB":>10} {"max RSS MB":>11} {"pending":>8}')
+    for i, num in enumerate(log_numbers(millions * 1_000_000), 1):
+        index.add(num)
+        if i % 1_000_000 == 0:
+            current, _ = tracemalloc.get_traced_memory()
+            print(f'{i:>10} {current / 1048576:>10.2f} {rss_mb():>11.1f} {len(index.pending):>8}')
+    elapsed = time.perf_counter() - start
+    print(f'{i / elapsed:,.0f} messages/s')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,47 @@
+"""
+Latency benchmark of Shell.push_log.
+
+Pushes a million log lines into the attached shell log pane and reports the per-append
+latency percentiles plus the time needed to render one screen of the tail.
+
+    python -m benchmarks.bench_shell_logs [lines]
+"""
+import sys
+import time
+
+from fz_manager.factorio_zone_api import FZClient
+from fz_manager.shell import Shell
+from fz_manager.storage import Storage
+from fz_manager.utils import Term
+
+
+def main(n_lines: int = 1_000_000):
+    shell = Shell(FZClient(), Storage())
+    samples = []
+    for i in range(n_lines):
+        line = Term.info('info', f'[{i}] Player joined the game') if i % 10 else f'{i} plain log line'
+        start = time.perf_counter_ns()
+        shell.push_log(line)
+        samples.append(time.perf_counter_ns() - start)
+
+    samples.sort()
+    for p in (50, 90, 99, 99.9):
+        print(f'p{p:<5} {samples[int(len(samples) * p / 100) - 1] / 1000:8.2f} us')
+    print(f'max    {samples[-1] / 1000:8.2f} us')
+    print(f'total  {sum(samples) / 1e9:8.2f} s for {n_lines:,} lines, {len(shell.logs):,} kept')
+
+    start = time.perf_counter()
+    content = shell.logs_control.create_content(200, 60)
+    for i in range(content.line_count):
+        content.get_line(i)
+    print(f'render {(time.perf_counter() - start) * 1000:8.2f} ms for {content.line_count} visible lines')
+
+    start = time.perf_counter()
+    content = shell.logs_control.create_content(200, 60)
+    for i in range(content.line_count):
+        content.get_line(i)
+    print(f'redraw {(time.perf_counter() - start) * 1000:8.2f} ms with cached lines')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,65 @@
+"""
+Startup benchmark of the fzm entry point.
+
+Measures, in fresh interpreters, the time to import the interactive entry point and the time until
+the token prompt is shown and answered, and checks that the modules only needed later are not loaded.
+Exits with status 1 when a median exceeds its budget, so it can gate CI.
+
+    python -m benchmarks.bench_startup [runs] [import budget ms] [prompt budget ms]
+"""
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+IMPORT_BUDGET_MS = 250
+PROMPT_BUDGET_MS = 400
+# Modules loaded on first use, never before the first prompt
+DEFERRED_MODULES = ('aiohttp', 'rich', 'aioconsole', 'fz_manager.shell')
+
+IMPORT_SCRIPT = 'import fz_manager.cli, fz_manager.main'
+PROMPT_SCRIPT = f'''
+import asyncio, sys
+from prompt_toolkit.application import create_app_session
+from prompt_toolkit.input import create_pipe_input
+from prompt_toolkit.output import DummyOutput
+import fz_manager.cli
+from fz_manager.main import Main
+
+with create_pipe_input() as pipe, create_app_session(input=pipe, output=DummyOutput()):
+    pipe.send_text('token\\r')
+    asyncio.run(Main().choose_token())
+print(','.join(m for m in {DEFERRED_MODULES!r} if m in sys.modules))
+'''
+
+
+def run(script: str, env_tmp: str) -> tuple[float, str]:
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True,
+                         env={'TMPDIR': env_tmp, 'PATH': ''}).stdout
+    return (time.perf_counter() - start) * 1000, out.strip().splitlines()[-1] if out.strip() else ''
+
+
+def main(runs: int = 10, import_budget: float = IMPORT_BUDGET_MS, prompt_budget: float = PROMPT_BUDGET_MS) -> int:
+    with tempfile.TemporaryDirectory() as tmp:
+        baseline = statistics.median(run('pass', tmp)[0] for _ in range(runs))
+        imports = statistics.median(run(IMPORT_SCRIPT, tmp)[0] for _ in range(runs)) - baseline
+        prompts = [run(PROMPT_SCRIPT, tmp) for _ in range(runs)]
+    prompt = statistics.median(ms for ms, _ in prompts) - baseline
+    loaded = prompts[-1][1]
+
+    print(f'interpreter  {baseline:8.1f} ms')
+    print(f'import       {imports:8.1f} ms  (budget {import_budget:.0f} ms)')
+    print(f'first prompt {prompt:8.1f} ms  (budget {prompt_budget:.0f} ms)')
+    print(f'deferred modules loaded: {loaded or "none"}')
+
+    failed = imports > import_budget or prompt > prompt_budget or bool(loaded)
+    if failed:
+        print('over budget')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    args = [float(a) for a in sys.argv[1:]]
+    sys.exit(main(int(args[0]) if args else 10, *args[1:]))
@@ -0,0 +1,58 @@
+import hashlib
+import json
+import time
+from os import path
+
+from fz_manager.factorio_zone_api import CATALOGS, FZClient
+from fz_manager.kvstore import atomic_write
+from fz_manager.state import StateChange
+
+
+class CatalogCache:
+    """
+    Last catalogs seen by each user token, served by the menus while the websocket revalidates them.
+    Entries are keyed by a hash of the token, so the cache never holds the token itself.
+    """
+
+    def __init__(self, cache_path: str):
+        self.cache_path = cache_path
+        self.entries: dict[str, dict] = {}
+        self.dirty = False
+        self.load()
+
+    @staticmethod
+    def key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def load(self) -> None:
+        if not path.isfile(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, 'r') as fp:
+                self.entries = json.load(fp)
+        except (IOError, ValueError):
+            self.entries = {}
+
+    def persist(self) -> None:
+        if not self.dirty:
+            return
+        atomic_write(self.cache_path, json.dumps(self.entries).encode())
+        self.dirty = False
+
+    def get(self, token: str | None) -> dict | None:
+        if not token or not (entry := self.entries.get(self.key(token))):
+            return None
+        return {c: entry[c] for c in CATALOGS if c in entry}
+
+    def put(self, token: str, **catalogs) -> None:
+        entry = self.entries.setdefault(self.key(token), {})
+        entry.update(catalogs, updated=time.time())
+        self.dirty = True
+
+    def track(self, client: FZClient) -> None:
+        """Keeps the entry of the client token up to date with the fresh catalogs it receives."""
+        def on_change(change: StateChange):
+            if client.user_token and change.key not in client.stale:
+                self.put(client.user_token, **{change.key: change.new})
+
+        client.state.subscribe(on_change, *CATALOGS)
@@ -0,0 +1,300 @@
+import argparse
+import asyncio
+import json
+import signal
+import sys
+import time
+from os import path, walk
+
+from fz_manager.daemon import Daemon, RemoteClient
+from fz_manager.factorio_zone_api import FZClient, ServerStatus, UPLOAD_CONCURRENCY, DOWNLOAD_CONCURRENCY
+from fz_manager.log_archive import LogArchive
+from fz_manager.mods_manifest import ModsManifest
+from fz_manager.storage import Storage
+from fz_manager.utils import executor, run_on_thread
+
+CONNECT_TIMEOUT = 30
+PROGRESS_INTERVAL = 0.5  # seconds between progress events of the same item
+
+EXIT_OK = 0
+EXIT_FAILURE = 1
+EXIT_USAGE = 2
+EXIT_TIMEOUT = 3
+EXIT_DISCONNECTED = 4
+EXIT_INTERRUPTED = 130
+
+
+def emit(event: str, **fields) -> None:
+    """Writes one JSON-lines event to stdout."""
+    sys.stdout.write(json.dumps({'event': event, 'ts': round(time.time(), 3), **fields}) + '\n')
+    sys.stdout.flush()
+
+
+class CliError(Exception):
+    def __init__(self, message: str, code: int = EXIT_FAILURE):
+        super().__init__(message)
+        self.code = code
+
+
+class ProgressEvents:
+    """Emits `progress` events for named items, at most one every `interval` seconds per item plus the final one."""
+
+    def __init__(self, operation: str, interval: float = PROGRESS_INTERVAL):
+        self.operation = operation
+        self.interval = interval
+        self.last: dict[str, float] = {}
+
+    def __call__(self, item: str, done: int, total: int | None) -> None:
+        now = time.monotonic()
+        if done != total and now - self.last.get(item, 0.0) < self.interval:
+            return
+        self.last[item] = now
+        emit('progress', operation=self.operation, item=item, done=done, total=total)
+
+
+class Cli:
+    """
+    Non-interactive subcommands for scripts, CI and cron jobs.
+    Output is a stream of JSON-lines events on stdout and the outcome is the process exit code.
+    The session of a running daemon is reused, otherwise a connection is opened with the given or last used token.
+    """
+
+    def __init__(self, storage: Storage, token: str = None):
+        self.storage = storage
+        self.token = token
+        self.client: FZClient | None = None
+        self.connection: asyncio.Task | None = None
+        self.archive: LogArchive | None = None
+
+    async def run(self, args: argparse.Namespace) -> int:
+        try:
+            await self.open()
+            return await args.handler(self, args)
+        except CliError as ex:
+            emit('error', message=str(ex))
+            return ex.code
+        except asyncio.TimeoutError:
+            emit('error', message='Timed out')
+            return EXIT_TIMEOUT
+        except asyncio.CancelledError:
+            emit('interrupted')
+            return EXIT_INTERRUPTED
+        except Exception as ex:
+            emit('error', message=str(ex) or ex.__class__.__name__)
+            return EXIT_FAILURE
+        finally:
+            await self.close()
+
+    async def open(self) -> None:
+        self.archive = LogArchive(self.storage.logs_archive_path)
+        self.client = await RemoteClient.attach(self.storage.daemon_socket_path)
+        if self.client is None:
+            token = self.token or self.storage.get('userToken')
+            if not token:
+                raise CliError('No userToken stored, pass --token', EXIT_USAGE)
+            self.client = FZClient(token)
+            self.client.add_logs_listener(lambda log: self.archive.append(log, self.client.launch_id))
+        self.connection = asyncio.create_task(self.client.connect())
+        try:
+            await self.client.wait_sync(CONNECT_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise CliError('Unable to connect to factorio.zone', EXIT_DISCONNECTED)
+        emit('connected', daemon=isinstance(self.client, RemoteClient), status=self.client.server_status,
+             launch_id=self.client.launch_id, address=self.client.server_address,
+             timings={phase: round(elapsed, 3) for phase, elapsed in self.client.timer.marks.items()})
+
+    async def close(self) -> None:
+        if self.client is not None:
+            await self.client.close()
+        if self.connection is not None:
+            self.connection.cancel()
+        if self.archive is not None:
+            self.archive.close()
+        await executor.shutdown()
+
+    def follow_logs(self) -> None:
+        self.client.add_logs_listener(lambda log: emit('log', line=log))
+
+    # ------ Instance -------------------------------------------------------------------
+    async def start(self, args: argparse.Namespace) -> int:
+        region = args.region or self.storage.get('region')
+        version = args.version or self.storage.get('version')
+        slot = args.slot or self.storage.get('slot')
+        if region not in self.client.regions:
+            raise CliError(f'Unknown region {region}, available: {", ".join(sorted(self.client.regions))}', EXIT_USAGE)
+        if version not in self.client.versions:
+            raise CliError(f'Unknown version {version}, available: {", ".join(self.client.versions)}', EXIT_USAGE)
+        if f'slot{slot}' not in self.client.saves:
+            raise CliError(f'Unknown slot {slot}', EXIT_USAGE)
+        if self.client.running:
+            raise CliError(f'Server already {self.client.server_status}')
+
+        self.follow_logs()
+        await self.client.start_instance(region, version, f'slot{slot}')
+        emit('starting', launch_id=self.client.launch_id, region=region, version=version, slot=slot)
+        if args.no_wait:
+            return EXIT_OK
+        await self.client.wait_for(lambda: self.client.server_status != ServerStatus.OFFLINE, args.timeout)
+        await self.client.wait_for(lambda: self.client.server_status in (ServerStatus.RUNNING, ServerStatus.OFFLINE),
+                                   args.timeout)
+        if self.client.server_status != ServerStatus.RUNNING:
+            raise CliError('Server stopped while starting')
+        emit('running', launch_id=self.client.launch_id, address=self.client.server_address)
+        return EXIT_OK
+
+    async def stop(self, args: argparse.Namespace) -> int:
+        if not self.client.running:
+            raise CliError('Server is not running')
+        self.follow_logs()
+        await self.client.stop_instance()
+        await self.client.wait_status(ServerStatus.OFFLINE, args.timeout)
+        emit('stopped')
+        return EXIT_OK
+
+    async def logs(self, args: argparse.Namespace) -> int:
+        launch_id = args.launch or self.client.launch_id
+        if launch_id is not None:
+            for ts, line in await run_on_thread(lambda: list(self.archive.query(launch_id=str(launch_id)))):
+                emit('log', ts=ts, line=line)
+        if not args.follow:
+            return EXIT_OK
+        self.follow_logs()
+        await self.connection
+        emit('error', message='Connection closed')
+        return EXIT_DISCONNECTED
+
+    # ------ Mods -----------------------------------------------------------------------
+    async def upload_mods(self, args: argparse.Namespace) -> int:
+        if not path.isdir(args.directory):
+            raise CliError(f'{args.directory} is not a directory', EXIT_USAGE)
+        root, _, filenames = next(walk(args.directory), (None, None, []))
+        mods = [FZClient.Mod(n, path.join(root, n), path.getsize(path.join(root, n)))
+                for n in sorted(filenames) if n.endswith('.zip')]
+
+        manifest = ModsManifest(self.storage.mods_manifest_path)
+        if not args.force:
+            mods, skipped = await manifest.partition(mods, self.client.mods)
+            for mod in skipped:
+                emit('skipped', mod=mod.name)
+
+        progress = ProgressEvents('upload')
+        sent = []
+
+        def on_done(mod: FZClient.Mod, error: Exception | None):
+            if error:
+                emit('failed', mod=mod.name, message=str(error) or error.__class__.__name__)
+            else:
+                sent.append(mod)
+                emit('uploaded', mod=mod.name, size=mod.size)
+
+        limit = args.concurrency or self.storage.get('uploadConcurrency') or UPLOAD_CONCURRENCY
+        results = await self.client.upload_mods(mods, lambda mod, n: progress(mod.name, n, mod.size), on_done, limit)
+        for mod, error in results:
+            if error and mod in sent:
+                # Sent, but never listed by the server
+                emit('failed', mod=mod.name, message=str(error))
+        await run_on_thread(manifest.mark_uploaded, *[mod for mod, error in results if not error])
+        manifest.persist()
+        failed = sum(1 for _, error in results if error)
+        emit('done', uploaded=len(results) - failed, failed=failed)
+        return EXIT_FAILURE if failed else EXIT_OK
+
+    # ------ Saves ----------------------------------------------------------------------
+    async def download_saves(self, args: argparse.Namespace) -> int:
+        if not path.isdir(args.directory):
+            raise CliError(f'{args.directory} is not a directory', EXIT_USAGE)
+        if args.all:
+            names = [name for name, text in self.client.saves.items() if not text.endswith('(empty)')]
+        else:
+            names = [f'slot{n}' for n in args.slot]
+            if unknown := [n for n in names if n not in self.client.saves]:
+                raise CliError(f'Unknown slots {", ".join(unknown)}', EXIT_USAGE)
+        slots = [(name, path.join(args.directory, f'{name}.zip')) for name in names]
+
+        progress = ProgressEvents('download')
+
+        def on_done(slot: tuple[str, str], error: Exception | None):
+            if error:
+                emit('failed', slot=slot[0], message=str(error) or error.__class__.__name__)
+            else:
+                emit('downloaded', slot=slot[0], path=slot[1])
+
+        limit = args.concurrency or self.storage.get('downloadConcurrency') or DOWNLOAD_CONCURRENCY
+        results = await self.client.download_save_slots(slots, progress, on_done, limit)
+        failed = sum(1 for _, error in results if error)
+        emit('done', downloaded=len(results) - failed, failed=failed)
+        return EXIT_FAILURE if failed else EXIT_OK
+
+
+async def run_daemon(storage: Storage, token: str = None) -> int:
+    """Serves the session to later fzm invocations until interrupted."""
+    client = FZClient(token or storage.get('userToken'))
+    daemon = Daemon(client, storage.daemon_socket_path, LogArchive(storage.logs_archive_path))
+    print(f'Serving session on {storage.daemon_socket_path}')
+    try:
+        await daemon.serve()
+    finally:
+        await executor.shutdown()
+    return EXIT_OK
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='fzm', description='Factorio Zone Server Manager. '
+                                                             'Without a command the interactive menus are shown.')
+    parser.add_argument('--token', help='userToken to log in with, defaults to the last one used')
+    commands = parser.add_subparsers(dest='command', metavar='command')
+
+    commands.add_parser('daemon', help='keep the session in the background, shared by later invocations')
+
+    start = commands.add_parser('start', help='start the server, defaults to the last used options')
+    start.add_argument('--region')
+    start.add_argument('--version')
+    start.add_argument('--slot', type=int)
+    start.add_argument('--no-wait', action='store_true', help='return once the start request is accepted')
+    start.add_argument('--timeout', type=float, help='seconds to wait for the server to be running')
+    start.set_defaults(handler=Cli.start)
+
+    stop = commands.add_parser('stop', help='stop the server')
+    stop.add_argument('--timeout', type=float, help='seconds to wait for the server to be offline')
+    stop.set_defaults(handler=Cli.stop)
+
+    logs = commands.add_parser('logs', help='print the archived logs of the current launch')
+    logs.add_argument('--follow', '-f', action='store_true', help='keep streaming new log lines')
+    logs.add_argument('--launch', help='launch id to print instead of the current one')
+    logs.set_defaults(handler=Cli.logs)
+
+    mods = commands.add_parser('mods', help='manage mods').add_subparsers(dest='action', metavar='action',
+                                                                          required=True)
+    upload = mods.add_parser('upload', help='upload the .zip mods of a directory')
+    upload.add_argument('directory')
+    upload.add_argument('--force', action='store_true', help='upload mods already uploaded as well')
+    upload.add_argument('--concurrency', type=int)
+    upload.set_defaults(handler=Cli.upload_mods)
+
+    saves = commands.add_parser('saves', help='manage saves').add_subparsers(dest='action', metavar='action',
+                                                                             required=True)
+    download = saves.add_parser('download', help='download save slots to a directory')
+    selection = download.add_mutually_exclusive_group(required=True)
+    selection.add_argument('--all', action='store_true', help='every non-empty slot')
+    selection.add_argument('--slot', type=int, action='append', help='slot number, may be repeated')
+    download.add_argument('directory')
+    download.add_argument('--concurrency', type=int)
+    download.set_defaults(handler=Cli.download_saves)
+    return parser
+
+
+def main():
+    args = create_parser().parse_args()
+    if args.command is None:
+        from fz_manager.main import main as interactive
+        return interactive()
+
+    storage = Storage()
+    loop = asyncio.get_event_loop_policy().get_event_loop()
+    if args.command == 'daemon':
+        sys.exit(loop.run_until_complete(run_daemon(storage, args.token)))  # pragma: no cover
+
+    task = loop.create_task(Cli(storage, args.token).run(args))
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, task.cancel)
+    sys.exit(loop.run_until_complete(task))  # pragma: no cover
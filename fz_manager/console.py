@@ -0,0 +1,90 @@
+import asyncio
+import time
+from collections import deque
+from typing import Callable
+
+from fz_manager.factorio_zone_api import FZClient
+
+COMMAND_DEPTH = 1
+SCRIPT_COMMENT = '#'
+
+
+class CommandQueue:
+    """
+    Ordered queue of console commands.
+    Commands are dispatched in submission order with at most `depth` requests in flight and,
+    if `rate` is set, no more than `rate` dispatches per second. Results are reported to `on_result`
+    in submission order with the round-trip latency in seconds.
+    With `depth` above 1 requests travel on separate connections, so the server may execute them out of order.
+    """
+
+    def __init__(self,
+                 client: FZClient,
+                 on_result: Callable[[str, float, Exception | None], None],
+                 depth: int = COMMAND_DEPTH,
+                 rate: float = None):
+        self.client = client
+        self.on_result = on_result
+        self.depth = depth
+        self.rate = rate
+        self.queue: asyncio.Queue[tuple[str, asyncio.Future]] = asyncio.Queue()
+        self.in_flight: deque[tuple[str, asyncio.Task, asyncio.Future]] = deque()
+        self.slots = asyncio.Semaphore(depth)
+        self.worker: asyncio.Task | None = None
+        self.last_dispatch = 0.0
+
+    def submit(self, command: str) -> asyncio.Future:
+        """Enqueues `command`, returning a future resolved with its (latency, error) once the request completes."""
+        if self.worker is None or self.worker.done():
+            self.worker = asyncio.create_task(self.dispatch())
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((command, future))
+        return future
+
+    async def dispatch(self):
+        while True:
+            command, future = await self.queue.get()
+            await self.slots.acquire()
+            if self.rate:
+                delay = self.last_dispatch + 1 / self.rate - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            self.last_dispatch = time.monotonic()
+            task = asyncio.create_task(self.send(command))
+            self.in_flight.append((command, task, future))
+            task.add_done_callback(lambda _: self.report())
+
+    async def send(self, command: str) -> tuple[float, Exception | None]:
+        start = time.monotonic()
+        error = None
+        try:
+            await self.client.send_command(command)
+        except Exception as ex:
+            error = ex
+        finally:
+            self.slots.release()
+        return time.monotonic() - start, error
+
+    def report(self):
+        while self.in_flight and self.in_flight[0][1].done():
+            command, task, future = self.in_flight.popleft()
+            latency, error = (0.0, asyncio.CancelledError()) if task.cancelled() else task.result()
+            self.on_result(command, latency, error)
+            if not future.done():
+                future.set_result((latency, error))
+
+    async def run_script(self, file_path: str) -> tuple[int, int]:
+        """Streams the commands of `file_path`, one per line, returning the number of commands sent and failed."""
+        futures = []
+        with open(file_path, 'r') as fp:
+            for line in fp:
+                command = line.strip()
+                if command and not command.startswith(SCRIPT_COMMENT):
+                    futures.append(self.submit(command))
+                    await asyncio.sleep(0)
+        results = await asyncio.gather(*futures)
+        return len(results), sum(1 for _, error in results if error)
+
+    def close(self):
+        if self.worker is not None:
+            self.worker.cancel()
@@ -0,0 +1,186 @@
+import asyncio
+import json
+import os
+import signal
+from os import path
+
+from fz_manager.dispatch import MessageType, json_loads
+from fz_manager.factorio_zone_api import FZClient
+from fz_manager.log_archive import LogArchive
+from fz_manager.utils import RingBuffer, Term
+
+REPLAY_FRAMES = 1000
+SUBSCRIBER_BUFFER_LIMIT = 4194304  # 4MB
+LOG_FRAMES = (MessageType.LOG, MessageType.INFO, MessageType.WARN, MessageType.ERROR)
+
+
+def encode(message: dict) -> bytes:
+    return (json.dumps(message) + '\n').encode()
+
+
+class Daemon:
+    """
+    Owns the factorio.zone session and shares it over a Unix domain socket speaking JSON lines.
+
+    Requests are `{"id": n, "method": m, "params": {...}}` objects, answered with `{"id": n, "result": r}`
+    or `{"id": n, "error": e}`. Methods:
+        - `state`: snapshot of the client state, the visit secret and the user token
+        - `subscribe`: answers like `state` plus the recent log frames, then streams every websocket
+          frame received by the daemon as `{"event": "frame", "data": {...}}`
+    """
+
+    def __init__(self, client: FZClient, socket_path: str, archive: LogArchive = None):
+        self.client = client
+        self.socket_path = socket_path
+        self.archive = archive
+        self.server: asyncio.Server | None = None
+        self.connections: set[asyncio.StreamWriter] = set()
+        self.subscribers: set[asyncio.StreamWriter] = set()
+        self.log_frames = RingBuffer[dict](REPLAY_FRAMES)
+        for message_type, handler in list(client.handlers.items()):
+            client.register_handler(message_type, self.forwarding(handler))
+        if archive:
+            client.add_logs_listener(lambda log: archive.append(log, client.launch_id))
+
+    def forwarding(self, handler):
+        def forward(data: dict):
+            if data['type'] in LOG_FRAMES:
+                self.log_frames.append(data)
+            self.broadcast({'event': 'frame', 'data': data})
+            return handler(data)
+
+        return forward
+
+    def broadcast(self, message: dict) -> None:
+        line = encode(message)
+        for writer in list(self.subscribers):
+            if writer.is_closing() or writer.transport.get_write_buffer_size() > SUBSCRIBER_BUFFER_LIMIT:
+                # Too slow to keep up, the subscriber has to attach again
+                self.subscribers.discard(writer)
+                writer.close()
+            else:
+                writer.write(line)
+
+    def session(self) -> dict:
+        return {
+            'visit_secret': self.client.visit_secret,
+            'user_token': self.client.user_token,
+            'state': dict(self.client.state.snapshot().values)
+        }
+
+    async def serve(self) -> None:
+        if path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self.server = await asyncio.start_unix_server(self.handle, path=self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stop)
+        connection = asyncio.create_task(self.client.connect())
+        try:
+            await self.server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.stop()
+            await self.server.wait_closed()
+            connection.cancel()
+            await self.client.close()
+            if self.archive:
+                self.archive.close()
+            if path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    def stop(self) -> None:
+        """Stops serving, closing the attached connections the server would otherwise wait for."""
+        self.server.close()
+        for writer in list(self.connections):
+            writer.close()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections.add(writer)
+        try:
+            while line := await reader.readline():
+                request = json_loads(line)
+                response = {'id': request.get('id')}
+                try:
+                    response['result'] = await self.execute(request, writer)
+                except Exception as ex:
+                    response['error'] = str(ex) or ex.__class__.__name__
+                writer.write(encode(response))
+                await writer.drain()
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            self.connections.discard(writer)
+            self.subscribers.discard(writer)
+            writer.close()
+
+    async def execute(self, request: dict, writer: asyncio.StreamWriter):
+        match request.get('method'):
+            case 'state':
+                return self.session()
+            case 'subscribe':
+                self.subscribers.add(writer)
+                return {**self.session(), 'frames': list(self.log_frames)}
+            case method:
+                raise Exception(f'Unknown request {method}')
+
+
+class RemoteClient(FZClient):
+    """
+    FZClient attached to a Daemon instead of the factorio.zone websocket.
+    State and logs mirror the daemon session, HTTP API calls are made directly with its visit secret.
+    """
+
+    def __init__(self, socket_path: str):
+        super().__init__()
+        self.socket_path = socket_path
+        self.reader: asyncio.StreamReader | None = None
+        self.writer: asyncio.StreamWriter | None = None
+
+    @staticmethod
+    async def attach(socket_path: str) -> 'RemoteClient | None':
+        """Returns a client attached to the daemon listening on `socket_path`, or None if none is running."""
+        if not path.exists(socket_path):
+            return None
+        client = RemoteClient(socket_path)
+        try:
+            client.reader, client.writer = await asyncio.open_unix_connection(socket_path)
+        except (ConnectionError, FileNotFoundError):
+            return None
+        return client
+
+    async def connect(self):
+        self.logs_task = asyncio.create_task(self.dispatch_logs())
+        self.writer.write(encode({'id': 0, 'method': 'subscribe'}))
+        while line := await self.reader.readline():
+            message = json_loads(line)
+            if 'result' in message:
+                session = message['result']
+                self.visit_secret = session['visit_secret']
+                self.user_token = session['user_token']
+                self.state.update(**session['state'])
+                for frame in session['frames']:
+                    await self.handlers[frame['type']](frame)
+            elif message.get('event') == 'frame':
+                data = message['data']
+                if handler := self.handlers.get(data['type']):
+                    if (result := handler(data)) is not None:
+                        await result
+            await self.notify_state_changed()
+        self.connected = False
+        await self.on_new_log(Term.warn('warn', 'Daemon connection closed'))
+        await self.notify_state_changed()
+
+    async def on_visit(self, data: dict):
+        # The daemon logs in, attached clients only follow its visit secret
+        self.visit_secret = data['secret']
+
+    async def close(self):
+        self.closing = True
+        if self.logs_task is not None:
+            self.logs_task.cancel()
+        await self.transport.close()
+        if self.writer is not None:
+            self.writer.close()
@@ -0,0 +1,100 @@
+import asyncio
+import json
+
+try:
+    import orjson
+
+    json_loads = orjson.loads
+except ImportError:  # pragma: no cover
+    json_loads = json.loads
+
+LOGS_QUEUE_SIZE = 1024
+LOGS_INDEX_WINDOW = 4096
+
+
+class MessageType:
+    VISIT = 'visit'
+    OPTIONS = 'options'
+    MODS = 'mods'
+    IDLE = 'idle'
+    STARTING = 'starting'
+    STOPPING = 'stopping'
+    RUNNING = 'running'
+    SLOT = 'slot'
+    LOG = 'log'
+    INFO = 'info'
+    WARN = 'warn'
+    ERROR = 'error'
+
+
+class Backpressure:
+    # Discard new lines while the queue is full
+    DROP = 'drop'
+    # Merge the queued lines into a single multi-line entry
+    COALESCE = 'coalesce'
+    # Suspend the socket reader until listeners catch up
+    BLOCK = 'block'
+
+
+class LogsQueue:
+    """
+    Bounded queue between the websocket reader and the logs listeners.
+    `policy` decides what happens to new lines while the queue is full.
+    """
+
+    def __init__(self, maxsize: int = LOGS_QUEUE_SIZE, policy: str = Backpressure.COALESCE):
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize)
+        self.policy = policy
+        self.dropped = 0
+
+    async def put(self, line: str) -> None:
+        if not self.queue.full():
+            self.queue.put_nowait(line)
+            return
+        match self.policy:
+            case Backpressure.DROP:
+                self.dropped += 1
+            case Backpressure.COALESCE:
+                lines = [self.queue.get_nowait() for _ in range(self.queue.qsize())]
+                self.queue.put_nowait('\n'.join(lines + [line]))
+            case Backpressure.BLOCK:
+                await self.queue.put(line)
+
+    async def get(self) -> str:
+        line = await self.queue.get()
+        if self.dropped:
+            line = f'... {self.dropped} log lines dropped\n{line}'
+            self.dropped = 0
+        return line
+
+
+class LogsIndex:
+    """
+    Constant-memory de-duplication of log numbers.
+    Every number up to `watermark` counts as seen, newer ones are kept in a set until the gap below them closes.
+    Numbers falling more than `window` behind the newest one are given up on and absorbed by the watermark.
+    """
+
+    def __init__(self, window: int = LOGS_INDEX_WINDOW):
+        self.window = window
+        self.watermark: int | None = None
+        self.pending: set[int] = set()
+
+    def add(self, num: int) -> bool:
+        """Records `num`, returning False if it was already seen."""
+        if self.watermark is None:
+            self.watermark = num - 1
+        if num <= self.watermark or num in self.pending:
+            return False
+        self.pending.add(num)
+        if num - self.watermark > self.window:
+            # Forward jumps of any size, like lines skipped while reconnecting, cost O(window)
+            self.watermark = num - self.window
+            self.pending = {n for n in self.pending if n > self.watermark}
+        while self.watermark + 1 in self.pending:
+            self.watermark += 1
+            self.pending.remove(self.watermark)
+        return True
+
+    def __contains__(self, num: int) -> bool:
+        return self.watermark is not None and (num <= self.watermark or num in self.pending)
@@ -1,17 +1,34 @@
 import asyncio
-import json
 import re
 import ssl
+import traceback
 from inspect import iscoroutinefunction
+from os import path
 from typing import Callable, Coroutine
 
-import requests
-from requests_toolbelt import MultipartEncoder, MultipartEncoderMonitor
 from websockets import client
+from websockets.exceptions import WebSocketException
 
-from fz_manager.utils import Term
+from fz_manager.dispatch import Backpressure, LogsIndex, LogsQueue, MessageType, json_loads
+from fz_manager.state import ClientState, StateChange, StateField
+from fz_manager.transport import Transport
+from fz_manager.utils import PhaseTimer, Term, run_bounded
 
 FACTORIO_ZONE_ENDPOINT = 'factorio.zone'
+UPLOAD_CONCURRENCY = 4
+DOWNLOAD_CONCURRENCY = 3
+MOD_ACTIONS_CONCURRENCY = 8
+MODS_CONFIRM_TIMEOUT = 30
+RECONNECT_MAX_DELAY = 30
+# State keys listing what the server offers, cacheable between runs
+CATALOGS = ('regions', 'versions', 'saves', 'mods')
+MOD_FILE_PATTERN = re.compile(r'(.+)_(\d+\.\d+\.\d+)(?:\.zip)?')
+
+
+def parse_mod_name(filename: str) -> tuple[str, str | None]:
+    if match := MOD_FILE_PATTERN.fullmatch(filename):
+        return match[1], match[2]
+    return path.splitext(filename)[0], None
 
 
 class ServerStatus:
@@ -21,28 +38,105 @@ class ServerStatus:
     RUNNING = 'RUNNING'
 
 
+class ModAction:
+    ENABLE = 'enable'
+    DISABLE = 'disable'
+    DELETE = 'delete'
+
+
 class FZClient:
-    def __init__(self, token: str = None):
+    regions = StateField()
+    versions = StateField()
+    slots = StateField()
+    saves = StateField()
+    mods = StateField()
+    running = StateField()
+    launch_id = StateField()
+    server_address = StateField()
+    server_status = StateField()
+    connected = StateField()
+    mods_sync = StateField()
+    saves_sync = StateField()
+    stale = StateField()
+
+    def __init__(self, token: str = None, logs_policy: str = Backpressure.COALESCE, await_token: bool = False):
+        """
+        With `await_token` the websocket can be connected before the token is known,
+        login is then held back until `set_token` is called.
+        """
         self.socket = None
         self.user_token = token
+        self.token_ready = asyncio.Event()
+        if not await_token:
+            self.token_ready.set()
+        self.login_task: asyncio.Task | None = None
+        self.timer = PhaseTimer()
         self.visit_secret = None
         self.referrer_code = None
-        self.regions = {}
-        self.versions = {}
-        self.slots = {}
-        self.saves = {}
-        self.mods = []
-        self.running = False
-        self.launch_id = None
+        self.state = ClientState(
+            regions={},
+            versions={},
+            slots={},
+            saves={},
+            mods=[],
+            running=False,
+            launch_id=None,
+            server_address=None,
+            server_status=ServerStatus.OFFLINE,
+            connected=False,
+            mods_sync=False,
+            saves_sync=False,
+            stale=()
+        )
+        self.revalidated: set[str] = set()
         self.region = None
-        self.server_address = None
-        self.server_status = ServerStatus.OFFLINE
-        self.logs_map = {}
+        self.logs_index = LogsIndex()
+        self.last_log_num: int | None = None
+        self.logs_launch_id = None
+        self.state.subscribe(self.on_launch_changed, 'launch_id')
+        self.logged_in = False
+        self.closing = False
         self.logs_listeners: list[Callable[[str], Coroutine | Callable]] = []
-        self.mods_sync = False
-        self.saves_sync = False
+        self.transport = Transport(FACTORIO_ZONE_ENDPOINT)
+        self.state_changed = asyncio.Condition()
+        self.logs_queue = LogsQueue(policy=logs_policy)
+        self.logs_task: asyncio.Task | None = None
+        self.handlers: dict[str, Callable[[dict], Coroutine | None]] = {
+            MessageType.VISIT: self.on_visit,
+            MessageType.OPTIONS: self.on_options,
+            MessageType.MODS: self.on_mods,
+            MessageType.IDLE: self.on_idle,
+            MessageType.STARTING: self.on_starting,
+            MessageType.STOPPING: self.on_stopping,
+            MessageType.RUNNING: self.on_running,
+            MessageType.SLOT: self.on_slot,
+            MessageType.LOG: self.on_log,
+            MessageType.INFO: self.on_info,
+            MessageType.WARN: self.on_warn,
+            MessageType.ERROR: self.on_error,
+        }
 
     async def connect(self):
+        """Keeps the websocket connected, reconnecting with exponential backoff when it drops."""
+        self.logs_task = asyncio.create_task(self.dispatch_logs())
+        attempt = 0
+        while True:
+            try:
+                await self.open_socket()
+                attempt = 0
+                await self.receive()
+            except (WebSocketException, OSError, asyncio.TimeoutError) as ex:
+                self.connected = False
+                if self.closing:
+                    return
+                attempt += 1
+                delay = min(2 ** (attempt - 1), RECONNECT_MAX_DELAY)
+                await self.on_new_log(Term.warn('warn', f'Connection lost ({str(ex) or ex.__class__.__name__}), '
+                                                        f'reconnecting in {delay}s'))
+                await self.notify_state_changed()
+                await asyncio.sleep(delay)
+
+    async def open_socket(self):
         ssl_context = ssl.SSLContext()
         ssl_context.verify_mode = ssl.CERT_NONE
         ssl_context.check_hostname = False
@@ -52,68 +146,158 @@ class FZClient:
             ping_timeout=10,
             ssl=ssl_context
         )
+        self.timer.mark('socket')
+
+    async def receive(self):
         while True:
             message = await self.socket.recv()
-            data = json.loads(message)
-            match data['type']:
-                case 'visit':
-                    self.visit_secret = data['secret']
-                    self.login()
-                case 'options':
-                    match data['name']:
-                        case 'regions':
-                            self.regions = data['options']
-                        case 'versions':
-                            self.versions = data['options']
-                        case 'saves':
-                            self.saves = data['options']
-                            self.saves_sync = True
-                case 'mods':
-                    self.mods = data['mods']
-                    self.mods_sync = True
-                case 'idle':
-                    self.running = False
-                    self.launch_id = None
-                    self.server_status = ServerStatus.OFFLINE
-                    self.server_address = None
-                case "starting":
-                    self.running = True
-                    self.launch_id = data.get('launchId')
-                    self.server_status = ServerStatus.STARTING
-                case "stopping":
-                    self.running = True
-                    self.launch_id = data.get('launchId')
-                    self.server_status = ServerStatus.STOPPING
-                case 'running':
-                    self.running = True
-                    self.launch_id = data.get('launchId')
-                    self.server_address = data.get('socket')
-                    self.server_status = ServerStatus.RUNNING
-                case 'slot':
-                    self.slots[data['slot']] = data
-                case 'log':
-                    log_id = data['num']
-                    if log_id not in self.logs_map:
-                        log = data.get('line')
-                        self.logs_map[log_id] = log_id
-                        await self.on_new_log(log)
-                case 'info':
-                    line = data.get('line')
-                    if len(match := re.findall('selecting connection (\d+\.\d+\.\d+\.\d+:\d+)', line)):
-                        self.server_address = match[0]
-                        self.server_status = ServerStatus.STARTING
-                    log = Term.info('info', line)
-                    await self.on_new_log(log)
-                case 'warn':
-                    log = Term.warn('warn', data.get('line'))
-                    await self.on_new_log(log)
-                case 'error':
-                    log = Term.error('error', data.get('line'))
-                    await self.on_new_log(log)
-
-    async def wait_sync(self):
-        while not self.mods_sync or not self.saves_sync:
-            await asyncio.sleep(1)
+            try:
+                data = json_loads(message)
+                if handler := self.handlers.get(data['type']):
+                    if (result := handler(data)) is not None:
+                        await result
+                await self.notify_state_changed()
+            except Exception as ex:
+                # A malformed frame or a failing state subscriber must not end the connection
+                await self.on_new_log(Term.error('error', f'Skipped frame ({str(ex) or ex.__class__.__name__}): '
+                                                          f'{str(message)[:200]}'))
+
+    def register_handler(self, message_type: str, handler: Callable[[dict], Coroutine | None]):
+        self.handlers[message_type] = handler
+
+    # ------ Message handlers -----------------------------------------------------------
+    def on_visit(self, data: dict):
+        self.visit_secret = data['secret']
+        self.timer.mark('visit')
+        if self.login_task is not None:
+            self.login_task.cancel()
+        # Logging in takes a round trip, frames keep being processed meanwhile
+        self.login_task = asyncio.create_task(self.login_when_ready(reconnected=self.logged_in))
+
+    async def login_when_ready(self, reconnected: bool):
+        await self.token_ready.wait()
+        try:
+            await self.login(reconnected=reconnected)
+        except Exception as ex:
+            await self.on_new_log(Term.error('error', f'Login failed: {str(ex) or ex.__class__.__name__}'))
+            return
+        self.timer.mark('login')
+        self.logged_in = True
+        self.connected = True
+        await self.notify_state_changed()
+
+    def set_token(self, token: str | None):
+        """Sets the token to log in with, None to be assigned a new one."""
+        self.user_token = token
+        self.token_ready.set()
+
+    def on_options(self, data: dict):
+        match data['name']:
+            case 'regions':
+                self.revalidate('regions', regions=data['options'])
+            case 'versions':
+                self.revalidate('versions', versions=data['options'])
+            case 'saves':
+                self.revalidate('saves', saves=data['options'], saves_sync=True)
+
+    def on_mods(self, data: dict):
+        self.revalidate('mods', mods=data['mods'], mods_sync=True)
+
+    def revalidate(self, catalog: str, **values):
+        self.revalidated.add(catalog)
+        self.state.update(**values, stale=tuple(c for c in self.stale if c != catalog))
+
+    def seed(self, catalogs: dict):
+        """
+        Serves previously seen catalogs until the server sends fresh ones, listing them in `stale` meanwhile.
+        Catalogs already received from the server are left untouched.
+        """
+        values = {c: catalogs[c] for c in CATALOGS if c in catalogs and c not in self.revalidated}
+        if values:
+            self.state.update(**values, stale=tuple(sorted({*self.stale, *values})))
+
+    def on_idle(self, _: dict):
+        self.state.update(running=False, launch_id=None, server_status=ServerStatus.OFFLINE, server_address=None)
+
+    def on_starting(self, data: dict):
+        self.state.update(running=True, launch_id=data.get('launchId'), server_status=ServerStatus.STARTING)
+
+    def on_stopping(self, data: dict):
+        self.state.update(running=True, launch_id=data.get('launchId'), server_status=ServerStatus.STOPPING)
+
+    def on_running(self, data: dict):
+        self.state.update(running=True,
+                          launch_id=data.get('launchId'),
+                          server_address=data.get('socket'),
+                          server_status=ServerStatus.RUNNING)
+
+    def on_launch_changed(self, change: StateChange):
+        # Every launch numbers its logs from scratch, numbers seen in the previous one no longer apply
+        if change.new is not None and change.new != self.logs_launch_id:
+            self.logs_launch_id = change.new
+            self.logs_index = LogsIndex()
+            self.last_log_num = None
+
+    def on_slot(self, data: dict):
+        self.slots = {**self.slots, data['slot']: data}
+
+    async def on_log(self, data: dict):
+        log_id = data['num']
+        if self.logs_index.add(log_id):
+            if self.last_log_num is not None and log_id > self.last_log_num + 1:
+                await self.on_new_log(Term.warn('warn', f'{log_id - self.last_log_num - 1} log lines missed'))
+            if self.last_log_num is None or log_id > self.last_log_num:
+                self.last_log_num = log_id
+            await self.on_new_log(data.get('line'))
+
+    async def on_info(self, data: dict):
+        line = data.get('line')
+        if len(match := re.findall(r'selecting connection (\d+\.\d+\.\d+\.\d+:\d+)', line)):
+            self.state.update(server_address=match[0], server_status=ServerStatus.STARTING)
+        await self.on_new_log(Term.info('info', line))
+
+    async def on_warn(self, data: dict):
+        await self.on_new_log(Term.warn('warn', data.get('line')))
+
+    async def on_error(self, data: dict):
+        await self.on_new_log(Term.error('error', data.get('line')))
+
+    async def notify_state_changed(self):
+        async with self.state_changed:
+            self.state_changed.notify_all()
+
+    async def wait_for(self, predicate: Callable[[], bool], timeout: float = None):
+        """
+        Waits until `predicate` holds, re-evaluating it whenever a websocket message updates the client state.
+        Raises asyncio.TimeoutError if `timeout` seconds pass first.
+        """
+        async def wait():
+            async with self.state_changed:
+                await self.state_changed.wait_for(predicate)
+
+        await asyncio.wait_for(wait(), timeout)
+
+    async def wait_sync(self, timeout: float = None):
+        await self.wait_for(lambda: self.mods_sync and self.saves_sync, timeout)
+
+    async def wait_mods_sync(self, timeout: float = None):
+        await self.wait_for(lambda: self.mods_sync, timeout)
+
+    async def wait_saves_sync(self, timeout: float = None):
+        await self.wait_for(lambda: self.saves_sync, timeout)
+
+    async def wait_status(self, status: str, timeout: float = None):
+        await self.wait_for(lambda: self.server_status == status, timeout)
+
+    async def close(self):
+        self.closing = True
+        if self.logs_task is not None:
+            self.logs_task.cancel()
+        if self.login_task is not None:
+            self.login_task.cancel()
+        await self.transport.close()
+        if self.socket is not None:
+            await self.socket.close()
 
     def add_logs_listener(self, listener):
         self.logs_listeners.append(listener)
@@ -122,21 +306,34 @@ class FZClient:
         self.logs_listeners.remove(listener)
 
     async def on_new_log(self, log: str):
-        for listener in self.logs_listeners:
-            if iscoroutinefunction(listener):
-                await listener(log)
-            else:
-                listener(log)
+        await self.logs_queue.put(log)
+
+    async def dispatch_logs(self):
+        while True:
+            await self.deliver_log(await self.logs_queue.get())
+
+    async def deliver_log(self, log: str, failed_listener=None):
+        for listener in list(self.logs_listeners):
+            if listener is failed_listener:
+                continue
+            try:
+                if iscoroutinefunction(listener):
+                    await listener(log)
+                else:
+                    listener(log)
+            except Exception:
+                if failed_listener is None:
+                    # Reported to the other listeners only, a listener failing on every log cannot loop
+                    for line in traceback.format_exc().splitlines():
+                        await self.deliver_log(Term.error('error', line), listener)
 
     # ------ USER APIs ------------------------------------------------------------------
-    def login(self):
-        resp = requests.post(
-            url=f'https://{FACTORIO_ZONE_ENDPOINT}/api/user/login',
-            data={
-                'userToken': self.user_token,
-                'visitSecret': self.visit_secret,
-                'reconnected': False
-            })
+    async def login(self, reconnected: bool = False):
+        resp = await self.transport.post('/api/user/login', {
+            'userToken': self.user_token,
+            'visitSecret': self.visit_secret,
+            'reconnected': reconnected
+        })
         if resp.ok:
             body = resp.json()
             self.user_token = body['userToken']
@@ -153,50 +350,107 @@ class FZClient:
 
     async def toggle_mod(self, mod_id: int, enabled: bool):
         self.mods_sync = False
-        resp = requests.post(
-            url=f'https://{FACTORIO_ZONE_ENDPOINT}/api/mod/toggle',
-            data={
-                'visitSecret': self.visit_secret,
-                'modId': mod_id,
-                'enabled': enabled
-            })
+        resp = await self.transport.post('/api/mod/toggle', {
+            'visitSecret': self.visit_secret,
+            'modId': mod_id,
+            'enabled': enabled
+        })
         if not resp.ok:
             self.mods_sync = True
             raise Exception(f'Error in toggling mod: {resp.text}')
 
     async def delete_mod(self, mod_id: int):
         self.mods_sync = False
-        resp = requests.post(
-            url=f'https://{FACTORIO_ZONE_ENDPOINT}/api/mod/delete',
-            data={
-                'visitSecret': self.visit_secret,
-                'modId': mod_id
-            })
+        resp = await self.transport.post('/api/mod/delete', {
+            'visitSecret': self.visit_secret,
+            'modId': mod_id
+        })
         if not resp.ok:
             self.mods_sync = True
             raise Exception(f'Error in deleting mod: {resp.text}')
 
-    async def upload_mod(self, mod: Mod, cb: Callable = None):
-        file = open(mod.filePath, 'rb')
+    async def upload_mod(self, mod: Mod, cb: Callable[[int], None] = None):
         if mod.size > 268435456:  # 256MB
             raise Exception(f'Mod file must be under 256MB')
 
-        encoder = MultipartEncoder({
-            'visitSecret': self.visit_secret,
-            'file': (mod.name, file, 'application/x-zip-compressed'),
-            'size': str(mod.size)
-        })
-        monitor = MultipartEncoderMonitor(encoder, cb)
         self.mods_sync = False
-        resp = requests.post(
-            f'https://{FACTORIO_ZONE_ENDPOINT}/api/mod/upload',
-            headers={'content-type': monitor.content_type},
-            data=monitor
+        resp = await self.transport.upload(
+            '/api/mod/upload',
+            fields={
+                'visitSecret': self.visit_secret,
+                'file': None,
+                'size': mod.size
+            },
+            file_field='file',
+            file_name=mod.name,
+            file_path=mod.filePath,
+            content_type='application/x-zip-compressed',
+            cb=cb
         )
         if not resp.ok:
             self.mods_sync = True
             raise Exception(f'Error uploading mod: {resp.text}')
 
+    async def upload_mods(self,
+                          mods: list[Mod],
+                          cb: Callable[[Mod, int], None] = None,
+                          on_done: Callable[[Mod, Exception | None], None] = None,
+                          limit: int = UPLOAD_CONCURRENCY,
+                          timeout: float = MODS_CONFIRM_TIMEOUT) -> list[tuple[Mod, Exception | None]]:
+        results = await run_bounded(
+            mods,
+            lambda mod: self.upload_mod(mod, (lambda n_bytes: cb(mod, n_bytes)) if cb else None),
+            limit,
+            on_done
+        )
+
+        def pending() -> list[FZClient.Mod]:
+            remote = set()
+            for m in self.mods:
+                name, version = parse_mod_name(m.get('name') or m.get('text', ''))
+                remote.add((name, m.get('version', version)))
+            return [mod for mod, error in results if not error and parse_mod_name(mod.name) not in remote]
+
+        try:
+            await self.wait_for(lambda: not pending(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        unconfirmed = pending()
+        return [(mod, TimeoutError('Upload not confirmed by server') if mod in unconfirmed else error)
+                for mod, error in results]
+
+    async def apply_mod_actions(self,
+                                actions: list[tuple[int, str]],
+                                on_done: Callable[[tuple[int, str], Exception | None], None] = None,
+                                limit: int = MOD_ACTIONS_CONCURRENCY,
+                                timeout: float = MODS_CONFIRM_TIMEOUT) -> list[tuple[tuple[int, str], Exception | None]]:
+        async def apply(action: tuple[int, str]):
+            mod_id, name = action
+            if name == ModAction.DELETE:
+                await self.delete_mod(mod_id)
+            else:
+                await self.toggle_mod(mod_id, name == ModAction.ENABLE)
+
+        results = await run_bounded(actions, apply, limit, on_done)
+
+        def pending() -> list[tuple[int, str]]:
+            mods = {m['id']: m for m in self.mods}
+            return [a for a, error in results if not error and not self._mod_action_applied(a, mods)]
+
+        try:
+            await self.wait_for(lambda: not pending(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        unconfirmed = pending()
+        return [(a, TimeoutError('Change not confirmed by server') if a in unconfirmed else error) for a, error in results]
+
+    @staticmethod
+    def _mod_action_applied(action: tuple[int, str], mods: dict[int, dict]) -> bool:
+        mod_id, name = action
+        if name == ModAction.DELETE:
+            return mod_id not in mods
+        return mod_id in mods and mods[mod_id]['enabled'] == (name == ModAction.ENABLE)
+
     # ------ SAVE APIs ------------------------------------------------------------------
     class Save:
         def __init__(self, name: str, file_path: str, size: int, slot: str):
@@ -207,89 +461,83 @@ class FZClient:
 
     async def delete_save_slot(self, slot: str):
         self.saves_sync = False
-        resp = requests.post(
-            url=f'https://{FACTORIO_ZONE_ENDPOINT}/api/save/delete',
-            data={
-                'visitSecret': self.visit_secret,
-                'save': slot
-            })
+        resp = await self.transport.post('/api/save/delete', {
+            'visitSecret': self.visit_secret,
+            'save': slot
+        })
         if resp.status_code != 200:
             self.saves_sync = True
             raise Exception(f'Error deleting save: {resp.text}')
 
-    async def download_save_slot(self, slot: str, file_path: str, cb: Callable):
-        with requests.post(
-                url=f'https://{FACTORIO_ZONE_ENDPOINT}/api/save/download',
-                data={
-                    'visitSecret': self.visit_secret,
-                    'save': slot
-                },
-                stream=True
-        ) as resp:
-            if resp.status_code != 200:
-                self.saves_sync = True
-                raise Exception(f'Error downloading save: {resp.text}')
-            with open(file_path, 'wb') as file:
-                for chunk in resp.iter_content(chunk_size=8192):
-                    if chunk:
-                        file.write(chunk)
-                        cb(file.tell())
-                file.close()
-
-    async def upload_save(self, save: Save, cb: Callable = None):
-        file = open(save.filePath, 'rb')
+    async def download_save_slot(self, slot: str, file_path: str, cb: Callable[[int, int | None], None]):
+        try:
+            await self.transport.download('/api/save/download', {
+                'visitSecret': self.visit_secret,
+                'save': slot
+            }, file_path, cb)
+        except Exception as ex:
+            raise Exception(f'Error downloading save: {ex}')
+
+    async def download_save_slots(self,
+                                  slots: list[tuple[str, str]],
+                                  cb: Callable[[str, int, int | None], None] = None,
+                                  on_done: Callable[[tuple[str, str], Exception | None], None] = None,
+                                  limit: int = DOWNLOAD_CONCURRENCY) -> list[tuple[tuple[str, str], Exception | None]]:
+        return await run_bounded(
+            slots,
+            lambda s: self.download_save_slot(s[0], s[1], (lambda n_bytes, total: cb(s[0], n_bytes, total)) if cb else None),
+            limit,
+            on_done
+        )
+
+    async def upload_save(self, save: Save, cb: Callable[[int], None] = None):
         if save.size > 100663296:  # 96MB
             raise Exception('Save file must be under 96MB')
-        encoder = MultipartEncoder({
-            'visitSecret': self.visit_secret,
-            'file': (save.name, file, 'application/x-zip-compressed'),
-            'size': str(save.size),
-            'save': save.slot
-        })
-        monitor = MultipartEncoderMonitor(encoder, cb)
+
         self.saves_sync = False
-        resp = requests.post(
-            url=f'https://{FACTORIO_ZONE_ENDPOINT}/api/save/upload',
-            headers={'content-type': monitor.content_type},
-            data=monitor
+        resp = await self.transport.upload(
+            '/api/save/upload',
+            fields={
+                'visitSecret': self.visit_secret,
+                'file': None,
+                'size': save.size,
+                'save': save.slot
+            },
+            file_field='file',
+            file_name=save.name,
+            file_path=save.filePath,
+            content_type='application/x-zip-compressed',
+            cb=cb
         )
         if not resp.ok:
             self.saves_sync = True
             raise Exception(f'Error uploading save: {resp.text}')
 
     # ------ INSTANCE APIs --------------------------------------------------------------
-    def send_command(self, command):
-        resp = requests.post(
-            url=f'https://{FACTORIO_ZONE_ENDPOINT}/api/instance/console',
-            data={
-                'visitSecret': self.visit_secret,
-                'launchId': self.launch_id,
-                'input': command
-            })
+    async def send_command(self, command):
+        resp = await self.transport.post('/api/instance/console', {
+            'visitSecret': self.visit_secret,
+            'launchId': self.launch_id,
+            'input': command
+        })
         if resp.status_code != 200:
             raise Exception(f'Error sending console command: {resp.text}')
 
-    def start_instance(self, region, version, save):
-        resp = requests.post(
-            url=f'https://{FACTORIO_ZONE_ENDPOINT}/api/instance/start',
-            data={
-                'visitSecret': self.visit_secret,
-                'region': region,
-                'version': version,
-                'save': save
-            })
+    async def start_instance(self, region, version, save):
+        resp = await self.transport.post('/api/instance/start', {
+            'visitSecret': self.visit_secret,
+            'region': region,
+            'version': version,
+            'save': save
+        })
         if resp.status_code != 200:
             raise Exception(f'Error starting instance: {resp.text}')
         self.launch_id = resp.json()['launchId']
 
-    def stop_instance(self):
-        resp = requests.post(
-            url=f'https://{FACTORIO_ZONE_ENDPOINT}/api/instance/stop',
-            data={
-                'visitSecret': self.visit_secret,
-                'launchId': self.launch_id,
-            },
-            timeout=3600
-        )
+    async def stop_instance(self):
+        resp = await self.transport.post('/api/instance/stop', {
+            'visitSecret': self.visit_secret,
+            'launchId': self.launch_id,
+        }, timeout=3600)
         if resp.status_code != 200:
             raise Exception(f'Error stopping instance: {resp.text}')
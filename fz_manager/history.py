@@ -0,0 +1,109 @@
+import datetime
+import os
+from os import path
+from typing import Iterable, Iterator
+
+from prompt_toolkit.history import History
+
+from fz_manager.kvstore import atomic_write, file_lock
+
+HISTORY_MAX_ENTRIES = 1000
+COMPACT_INTERVAL = 100  # appended entries between compactions
+TAIL_BLOCK_SIZE = 4096
+
+
+class CappedFileHistory(History):
+    """
+    File history keeping at most `max_entries` distinct entries, readable by prompt_toolkit's FileHistory.
+    The file is read backwards from its tail, so loading costs O(max_entries) whatever the file size and
+    `latest` reads a single block. Entries equal to the previous one are not appended, older duplicates are
+    dropped when loading and by the compaction rewriting the file every COMPACT_INTERVAL appends, or as
+    soon as the file is found to hold more than `max_entries` entries.
+    """
+
+    def __init__(self, filename: str, max_entries: int = HISTORY_MAX_ENTRIES):
+        super().__init__()
+        self.filename = filename
+        self.max_entries = max_entries
+        self.appended = 0
+        self.oversized = False
+
+    def load_history_strings(self) -> Iterable[str]:
+        seen = set()
+        for entry in self.entries():
+            if entry in seen:
+                continue
+            if len(seen) == self.max_entries:
+                self.oversized = True
+                break
+            seen.add(entry)
+            yield entry
+        if self.oversized:
+            self.compact()
+
+    def append_string(self, string: str) -> None:
+        if string in self._loaded_strings:
+            self._loaded_strings.remove(string)
+        self._loaded_strings.insert(0, string)
+        del self._loaded_strings[self.max_entries:]
+        self.store_string(string)
+
+    def store_string(self, string: str) -> None:
+        if string == self.latest():
+            return
+        with file_lock(self.filename + '.lock'), open(self.filename, 'ab') as fp:
+            fp.write(_format_entry(string))
+        self.appended += 1
+        if self.appended >= COMPACT_INTERVAL or self.oversized:
+            self.compact()
+
+    def latest(self) -> str | None:
+        """The most recent entry, read from the end of the file."""
+        return next(self.entries(), None)
+
+    def entries(self) -> Iterator[str]:
+        """Entries from the most recent one, duplicates included."""
+        lines: list[str] = []
+        for line in _reverse_lines(self.filename):
+            if line.startswith('+'):
+                lines.append(line[1:])
+            elif lines:
+                yield '\n'.join(reversed(lines))
+                lines = []
+        if lines:
+            yield '\n'.join(reversed(lines))
+
+    def compact(self) -> None:
+        """Rewrites the file with the most recent `max_entries` distinct entries."""
+        with file_lock(self.filename + '.lock'):
+            kept = []
+            for entry in self.entries():
+                if entry not in kept:
+                    kept.append(entry)
+                    if len(kept) == self.max_entries:
+                        break
+            atomic_write(self.filename, b''.join(_format_entry(entry) for entry in reversed(kept)))
+        self.appended = 0
+        self.oversized = False
+
+
+def _format_entry(string: str) -> bytes:
+    # Same layout as prompt_toolkit's FileHistory
+    return (f'\n# {datetime.datetime.now()}\n' + ''.join(f'+{line}\n' for line in string.split('\n'))).encode()
+
+
+def _reverse_lines(file_path: str) -> Iterator[str]:
+    if not path.isfile(file_path):
+        return
+    with open(file_path, 'rb') as fp:
+        position = fp.seek(0, os.SEEK_END)
+        tail = b''
+        while position > 0:
+            size = min(TAIL_BLOCK_SIZE, position)
+            position -= size
+            fp.seek(position)
+            lines = (fp.read(size) + tail).split(b'\n')
+            tail = lines.pop(0)
+            for line in reversed(lines):
+                yield line.decode(errors='replace')
+        yield tail.decode(errors='replace')
@@ -0,0 +1,216 @@
+import json
+import os
+import sys
+from contextlib import contextmanager
+from os import path, umask
+from typing import Any, Callable, Iterator
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+    import msvcrt
+
+SCHEMA_VERSION = 2
+COMPACT_MIN_RECORDS = 256
+COMPACT_RATIO = 4  # journal records per live key that trigger a compaction
+
+# Upgrades of the stored values from a schema version to the next one
+MIGRATIONS: dict[int, Callable[[dict[str, Any]], dict[str, Any]]] = {
+    # v1 was a single JSON object rewritten on every persist, with the same keys
+    1: lambda values: values,
+}
+
+
+@contextmanager
+def file_lock(lock_path: str) -> Iterator[None]:
+    """Exclusive inter-process lock held on `lock_path` for the duration of the block."""
+    pre_umask = umask(77)
+    try:
+        fp = open(lock_path, 'a+')
+    finally:
+        umask(pre_umask)
+    with fp:
+        if fcntl:
+            fcntl.flock(fp.fileno(), fcntl.LOCK_EX)
+        else:  # pragma: no cover
+            fp.seek(0)
+            msvcrt.locking(fp.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(fp.fileno(), fcntl.LOCK_UN)
+            else:  # pragma: no cover
+                fp.seek(0)
+                msvcrt.locking(fp.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def atomic_write(file_path: str, data: bytes) -> None:
+    """Replaces `file_path` with `data` through a fsync'ed temporary file, readers never see a partial file."""
+    tmp_path = file_path + '.tmp'
+    pre_umask = umask(77)
+    try:
+        with open(tmp_path, 'wb') as fp:
+            fp.write(data)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp_path, file_path)
+    finally:
+        umask(pre_umask)
+    if hasattr(os, 'O_DIRECTORY'):
+        dir_fd = os.open(path.dirname(file_path) or '.', os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def _generation(data: bytes) -> str | None:
+    try:
+        header = json.loads(data.partition(b'\n')[0])
+    except ValueError:
+        return None
+    return header.get('generation') if isinstance(header, dict) else None
+
+
+def _record(key: str, value: Any) -> bytes:
+    return (json.dumps({'k': key, 'v': value}) + '\n').encode()
+
+
+class KeyValueStore:
+    """
+    Persistent key-value store shared by concurrent fzm processes.
+    The file is a journal: a `{"schema": n, "generation": g}` header followed by one `{"k": key, "v": value}`
+    line per update, so `persist` appends and fsyncs only the keys stored since the last call. Every access
+    to the file happens under an inter-process lock, records appended by other processes are replayed before
+    writing, and the last write of a key wins. Once superseded records dominate, the journal is compacted into
+    a fresh file with a new random generation that atomically replaces it, a generation change tells the other
+    processes to reload it. A torn trailing record left by a crash is discarded.
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.lock_path = file_path + '.lock'
+        self.values: dict[str, Any] = {}
+        self.dirty: set[str] = set()
+        self.offset = 0
+        self.records = 0
+        self.generation: str | None = None
+        self.load()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.values.get(key, default)
+
+    def set(self, key: str, value: Any) -> None:
+        self.values[key] = value
+        self.dirty.add(key)
+
+    def load(self) -> None:
+        with file_lock(self.lock_path):
+            self.offset = 0
+            self.sync()
+
+    def persist(self) -> None:
+        if not self.dirty:
+            return
+        with file_lock(self.lock_path):
+            self.sync()
+            data = b''.join(_record(k, self.values[k]) for k in sorted(self.dirty))
+            with open(self.file_path, 'r+b') as fp:
+                # Anything past the replayed records is a torn write
+                fp.truncate(self.offset)
+                fp.seek(self.offset)
+                fp.write(data)
+                fp.flush()
+                os.fsync(fp.fileno())
+            self.offset += len(data)
+            self.records += len(self.dirty)
+            self.dirty.clear()
+            if self.records > COMPACT_MIN_RECORDS and self.records > COMPACT_RATIO * len(self.values):
+                self.compact()
+
+    def sync(self) -> None:
+        """Replays the records appended since the last sync, reloading everything if the file was replaced."""
+        if not path.isfile(self.file_path):
+            self.compact()
+            return
+        with open(self.file_path, 'rb') as fp:
+            # Inode numbers are reused at once, only the generation tells a replaced journal apart
+            if _generation(fp.readline()) != self.generation or os.fstat(fp.fileno()).st_size < self.offset:
+                self.offset = 0
+            if self.offset == 0:
+                self.records = 0
+                self.values = {k: v for k, v in self.values.items() if k in self.dirty}
+            fp.seek(self.offset)
+            data = fp.read()
+        position = 0
+        if self.offset == 0:
+            if (position := self.read_header(data)) is None:
+                return
+            self.generation = _generation(data)
+        while (end := data.find(b'\n', position)) != -1:
+            try:
+                record = json.loads(data[position:end])
+                if record['k'] not in self.dirty:
+                    self.values[record['k']] = record['v']
+                self.records += 1
+            except (ValueError, KeyError, TypeError):
+                print(f'{self.file_path}: skipping corrupted record at byte {self.offset + position}',
+                      file=sys.stderr)
+            position = end + 1
+        self.offset += position
+
+    def read_header(self, data: bytes) -> int | None:
+        """Checks the schema of the file, returning the header size, or None if the file was migrated and rewritten."""
+        line, _, _ = data.partition(b'\n')
+        try:
+            header = json.loads(line)
+        except ValueError:
+            header = None
+        if isinstance(header, dict) and set(header) in ({'schema'}, {'schema', 'generation'}):
+            version = header['schema']
+            if version > SCHEMA_VERSION:
+                raise RuntimeError(f'{self.file_path} has schema {version}, newer than the supported {SCHEMA_VERSION}')
+            if version == SCHEMA_VERSION:
+                return len(line) + 1
+            values = self.replay(data[len(line) + 1:])
+        elif isinstance(header, dict):
+            version = 1
+            values = header
+        else:
+            if data.strip():
+                backup_path = f'{self.file_path}.corrupted'
+                os.replace(self.file_path, backup_path)
+                print(f'{self.file_path}: unreadable, moved to {backup_path}', file=sys.stderr)
+            version = SCHEMA_VERSION
+            values = {}
+
+        while version < SCHEMA_VERSION:
+            values = MIGRATIONS[version](values)
+            version += 1
+        self.values = {**values, **{k: v for k, v in self.values.items() if k in self.dirty}}
+        self.compact()
+        return None
+
+    @staticmethod
+    def replay(data: bytes) -> dict[str, Any]:
+        values = {}
+        for line in data.splitlines():
+            try:
+                record = json.loads(line)
+                values[record['k']] = record['v']
+            except (ValueError, KeyError, TypeError):
+                continue
+        return values
+
+    def compact(self) -> None:
+        """Rewrites the journal with one record per key. Must be called holding the lock."""
+        generation = os.urandom(8).hex()
+        data = (json.dumps({'schema': SCHEMA_VERSION, 'generation': generation}) + '\n').encode()
+        data += b''.join(_record(k, v) for k, v in sorted(self.values.items()))
+        atomic_write(self.file_path, data)
+        self.generation = generation
+        self.offset = len(data)
+        self.records = len(self.values)
+        self.dirty.clear()
@@ -0,0 +1,246 @@
+import asyncio
+import bisect
+import gzip
+import mmap
+import os
+import re
+import shutil
+import threading
+import time
+from os import path
+from typing import Iterator
+
+from fz_manager.utils import executor
+
+SEGMENT_SIZE = 16777216  # 16MB
+INDEX_INTERVAL = 1.0  # seconds between index entries
+NO_LAUNCH = 'idle'
+# Constructs matching differently in a whole segment than in a single line, which rule out the mapped pre-scan
+ANCHORS = re.compile(rb'\^|\\A|\(\?<[=!]')
+
+
+class LogArchive:
+    """
+    Append-only archive of console logs, one directory per launch id.
+    Lines are stored as `<epoch ms>\\t<line>` in numbered segments rotated at `segment_size` bytes,
+    closed segments are gzip-compressed in the background, the ones still queued when the archive is closed
+    are compressed by `close`. Every segment has a `.idx` file of
+    `<epoch ms> <offset>` entries, written at most every INDEX_INTERVAL seconds and when the segment
+    is closed, used to skip segments outside a time range and to seek inside uncompressed ones.
+    """
+
+    def __init__(self, root_path: str, segment_size: int = SEGMENT_SIZE):
+        self.root_path = root_path
+        self.segment_size = segment_size
+        self.launch_id: str | None = None
+        self.segment = 0
+        self.file = None
+        self.index = None
+        self.last_indexed = 0.0
+        self.last_ts = 0
+        self.pending: set[str] = set()
+        self.pending_lock = threading.Lock()
+        os.makedirs(self.root_path, exist_ok=True)
+
+    # ------ Writing --------------------------------------------------------------------
+    def append(self, line: str, launch_id: str | None = None, ts: float = None) -> None:
+        ts = time.time() if ts is None else ts
+        launch_id = str(launch_id) if launch_id else NO_LAUNCH
+        if launch_id != self.launch_id:
+            self.open(launch_id)
+        elif self.file.tell() >= self.segment_size:
+            self.rotate()
+        offset = self.file.tell()
+        self.last_ts = int(ts * 1000)
+        if ts - self.last_indexed >= INDEX_INTERVAL:
+            self.index.write(f'{self.last_ts} {offset}\n')
+            self.last_indexed = ts
+            self.file.flush()
+            self.index.flush()
+        self.file.write(''.join(f'{self.last_ts}\t{part}\n' for part in line.split('\n')).encode())
+
+    def open(self, launch_id: str) -> None:
+        self.close_segment()
+        self.launch_id = launch_id
+        launch_path = path.join(self.root_path, launch_id)
+        os.makedirs(launch_path, exist_ok=True)
+        segments = self.segments(launch_id)
+        if not segments:
+            self.segment = 1
+        else:
+            self.segment = segments[-1][0] + (1 if segments[-1][1].endswith('.gz') else 0)
+        self.open_segment()
+
+    def open_segment(self) -> None:
+        segment_path = self.segment_path(self.launch_id, self.segment)
+        self.file = open(segment_path, 'ab')
+        self.index = open(segment_path[:-len('.log')] + '.idx', 'a')
+        self.last_indexed = 0.0
+
+    def rotate(self) -> None:
+        closed = self.segment_path(self.launch_id, self.segment)
+        self.close_segment()
+        self.segment += 1
+        self.open_segment()
+        with self.pending_lock:
+            self.pending.add(closed)
+        try:
+            asyncio.get_running_loop()
+            executor.submit(self.compress_pending, closed)
+        except RuntimeError:
+            self.compress_pending(closed)
+
+    def compress_pending(self, segment_path: str) -> None:
+        # Whoever takes the segment out of `pending` compresses it, a background job or `close`
+        with self.pending_lock:
+            if segment_path not in self.pending:
+                return
+            self.pending.remove(segment_path)
+        compress(segment_path)
+
+    def close_segment(self) -> None:
+        if self.file is None:
+            return
+        self.index.write(f'{self.last_ts} {self.file.tell()}\n')
+        self.file.close()
+        self.index.close()
+        self.file = self.index = None
+
+    def close(self) -> None:
+        self.close_segment()
+        self.launch_id = None
+        with self.pending_lock:
+            pending = sorted(self.pending)
+        for segment_path in pending:
+            self.compress_pending(segment_path)
+
+    def flush(self) -> None:
+        if self.file is not None:
+            self.file.flush()
+            self.index.flush()
+
+    # ------ Reading --------------------------------------------------------------------
+    def launches(self) -> list[str]:
+        """Launch ids ordered by the time of their first archived line."""
+        def first_ts(launch_id: str) -> int:
+            segments = self.segments(launch_id)
+            entries = read_index(segments[0][1]) if segments else []
+            return entries[0][0] if entries else 0
+
+        ids = [d for d in os.listdir(self.root_path) if path.isdir(path.join(self.root_path, d))]
+        return sorted(ids, key=first_ts)
+
+    def segments(self, launch_id: str) -> list[tuple[int, str]]:
+        launch_path = path.join(self.root_path, launch_id)
+        if not path.isdir(launch_path):
+            return []
+        found = {}
+        for name in os.listdir(launch_path):
+            if match := re.fullmatch(r'(\d+)\.log(\.gz)?', name):
+                number = int(match[1])
+                if number not in found or not match[2]:
+                    found[number] = path.join(launch_path, name)
+        return sorted(found.items())
+
+    def segment_path(self, launch_id: str, segment: int) -> str:
+        return path.join(self.root_path, launch_id, f'{segment:06d}.log')
+
+    def query(self,
+              start: float = None,
+              end: float = None,
+              pattern: str = None,
+              launch_id: str = None) -> Iterator[tuple[float, str]]:
+        """
+        Yields the (timestamp, line) pairs archived between `start` and `end` (epoch seconds)
+        whose line matches the `pattern` regex, oldest first.
+        """
+        self.flush()
+        start_ms = int(start * 1000) if start is not None else None
+        end_ms = int(end * 1000) if end is not None else None
+        regex = re.compile(pattern.encode(), re.MULTILINE) if pattern else None
+        for launch in [launch_id] if launch_id else self.launches():
+            for _, segment_path in self.segments(launch):
+                entries = read_index(segment_path)
+                if entries and ((end_ms is not None and entries[0][0] > end_ms) or
+                                (start_ms is not None and entries[-1][0] < start_ms)):
+                    continue
+                for ts, line in scan_segment(segment_path, entries, start_ms, end_ms, regex):
+                    yield ts / 1000, line
+
+
+def compress(segment_path: str) -> None:
+    with open(segment_path, 'rb') as src, gzip.open(segment_path + '.gz.tmp', 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.replace(segment_path + '.gz.tmp', segment_path + '.gz')
+    os.remove(segment_path)
+
+
+def read_index(segment_path: str) -> list[tuple[int, int]]:
+    index_path = re.sub(r'\.log(\.gz)?$', '.idx', segment_path)
+    if not path.isfile(index_path):
+        return []
+    with open(index_path, 'r') as fp:
+        return [(int(ts), int(offset)) for ts, offset in (line.split() for line in fp if line.strip())]
+
+
+def scan_segment(segment_path: str,
+                 entries: list[tuple[int, int]],
+                 start_ms: int | None,
+                 end_ms: int | None,
+                 regex: re.Pattern | None) -> Iterator[tuple[int, str]]:
+    offset = 0
+    if start_ms is not None and entries:
+        i = bisect.bisect_left([ts for ts, _ in entries], start_ms) - 1
+        offset = entries[max(i, 0)][1]
+
+    if segment_path.endswith('.gz'):
+        with gzip.open(segment_path, 'rb') as fp:
+            fp.seek(offset)
+            yield from filter_lines(fp, start_ms, end_ms, regex)
+        return
+
+    if path.getsize(segment_path) == 0:
+        return
+    with open(segment_path, 'rb') as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if regex is None or start_ms is not None or end_ms is not None or ANCHORS.search(regex.pattern):
+            mm.seek(offset)
+            yield from filter_lines(iter(mm.readline, b''), start_ms, end_ms, regex)
+            return
+        # Plain grep: search the mapped segment directly and expand every match to its lines, which are
+        # checked one by one since a match found in the whole segment may span several of them
+        position = 0
+        while match := regex.search(mm, position):
+            line_start = mm.rfind(b'\n', 0, match.start()) + 1
+            line_end = mm.find(b'\n', match.end())
+            line_end = len(mm) if line_end == -1 else line_end
+            for raw in mm[line_start:line_end].split(b'\n'):
+                if (parsed := parse_line(raw)) and regex.search(message(raw)):
+                    yield parsed
+            position = line_end + 1
+
+
+def filter_lines(lines, start_ms: int | None, end_ms: int | None,
+                 regex: re.Pattern | None) -> Iterator[tuple[int, str]]:
+    for raw in lines:
+        raw = raw.rstrip(b'\n')
+        if not (parsed := parse_line(raw)):
+            continue
+        ts, line = parsed
+        if start_ms is not None and ts < start_ms:
+            continue
+        if end_ms is not None and ts > end_ms:
+            return
+        if regex is None or regex.search(message(raw)):
+            yield parsed
+
+
+def message(raw: bytes) -> bytes:
+    # Patterns are matched against the message alone, so anchors apply to it and not to the timestamp
+    return raw[raw.find(b'\t') + 1:]
+
+
+def parse_line(raw: bytes) -> tuple[int, str] | None:
+    ts, sep, line = raw.partition(b'\t')
+    if not sep or not ts.isdigit():
+        return None
+    return int(ts), line.decode(errors='replace')
@@ -0,0 +1,128 @@
+import asyncio
+import bisect
+import re
+
+from fz_manager.utils import Colors, RingBuffer, Term
+
+SCAN_CHUNK = 20000
+ANSI_ESCAPE = re.compile(r'\x1B(?:\[[0-?]*[ -/]*[@-~]|\][^\a]*\a)')
+
+
+class LogLevel:
+    INFO = 'info'
+    WARN = 'warn'
+    ERROR = 'error'
+
+
+LEVEL_PREFIXES = {
+    Term.fg(Colors.GREEN): LogLevel.INFO,
+    Term.fg(Colors.ORANGE): LogLevel.WARN,
+    Term.fg(Colors.RED): LogLevel.ERROR,
+}
+
+
+def line_level(line: str) -> str | None:
+    """Level of a line colored by Term.info/warn/error, None for plain server logs."""
+    for prefix, level in LEVEL_PREFIXES.items():
+        if line.startswith(prefix):
+            return level
+    return None
+
+
+class LogFilter:
+    """
+    Filter parsed from a query such as `level:warn player:Bob /desync|timeout/ some text`:
+    `level:` and `player:` terms select the line level and a player name, a /.../ term is a
+    regex and any other word is a case-insensitive substring. All the terms must match.
+    """
+
+    def __init__(self, query: str = ''):
+        self.query = query
+        self.level: str | None = None
+        self.player: re.Pattern | None = None
+        self.regex: re.Pattern | None = None
+        words = []
+        for term in re.findall(r'/(?:[^/\\]|\\.)+/|\S+', query):
+            if term.startswith('level:'):
+                self.level = term[len('level:'):].lower()
+            elif term.startswith('player:'):
+                self.player = re.compile(rf'\b{re.escape(term[len("player:"):])}\b', re.IGNORECASE)
+            elif len(term) > 2 and term.startswith('/') and term.endswith('/'):
+                self.regex = re.compile(term[1:-1])
+            else:
+                words.append(term.lower())
+        self.text = ' '.join(words)
+
+    @property
+    def active(self) -> bool:
+        return bool(self.level or self.player or self.regex or self.text)
+
+    def matches(self, line: str) -> bool:
+        if self.level and line_level(line) != self.level:
+            return False
+        plain = ANSI_ESCAPE.sub('', line) if '\x1B' in line else line
+        if self.text and self.text not in plain.lower():
+            return False
+        if self.player and not self.player.search(plain):
+            return False
+        return not self.regex or bool(self.regex.search(plain))
+
+
+class FilteredView:
+    """
+    Sequence of the lines of a RingBuffer matching a LogFilter.
+    Matches are kept as absolute line indexes, so new lines are tested once when they arrive and
+    lines evicted from the buffer simply fall out of the view. Changing the filter re-scans the buffer
+    in chunks, yielding to the event loop between them.
+    """
+
+    def __init__(self, lines: RingBuffer[str], log_filter: LogFilter = None):
+        self.lines = lines
+        self.filter = log_filter or LogFilter()
+        self.matches = RingBuffer[int](lines.capacity)
+        self.scanned = lines.first_index
+        self.scan_task: asyncio.Task | None = None
+
+    def set_filter(self, log_filter: LogFilter, on_progress=None) -> None:
+        if self.scan_task:
+            self.scan_task.cancel()
+        self.filter = log_filter
+        self.matches = RingBuffer[int](self.lines.capacity)
+        self.scanned = self.lines.first_index
+        self.scan_task = asyncio.create_task(self.rescan(on_progress))
+
+    async def rescan(self, on_progress=None) -> None:
+        while self.scanned < self.lines.total:
+            self.scan(SCAN_CHUNK)
+            if on_progress:
+                on_progress()
+            await asyncio.sleep(0)
+
+    def scan(self, limit: int = None) -> int:
+        """Tests the lines appended since the last scan, at most `limit` of them, returning how many matched."""
+        self.scanned = max(self.scanned, self.lines.first_index)
+        end = self.lines.total if limit is None else min(self.lines.total, self.scanned + limit)
+        matched = 0
+        first = self.lines.first_index
+        for index in range(self.scanned, end):
+            if self.filter.matches(self.lines[index - first]):
+                self.matches.append(index)
+                matched += 1
+        self.scanned = end
+        return matched
+
+    def on_line_added(self) -> int:
+        if self.scan_task and not self.scan_task.done():
+            return 0
+        return self.scan()
+
+    def start(self) -> int:
+        return bisect.bisect_left(self.matches, self.lines.first_index)
+
+    def __len__(self) -> int:
+        return len(self.matches) - self.start()
+
+    def __getitem__(self, index: int) -> str:
+        if index < 0:
+            index += len(self)
+        return self.lines[self.matches[self.start() + index] - self.lines.first_index]
@@ -1,20 +1,18 @@
 import asyncio
 import json
 import os
-import re
 import zipfile
 from os import path, walk
 
-from aioconsole import aprint
-from rich.progress import Progress
-
-from fz_manager.factorio_zone_api import FZClient, ServerStatus
+from fz_manager.catalog_cache import CatalogCache
+from fz_manager.daemon import RemoteClient
+from fz_manager.factorio_zone_api import FZClient, ModAction, ServerStatus, UPLOAD_CONCURRENCY, DOWNLOAD_CONCURRENCY
+from fz_manager.log_archive import LogArchive
 from fz_manager.menu import ActionMenu, SelectMenu, CheckboxMenu, MenuEntry, PathMenu, AlertMenu, InputMenu
-from fz_manager.shell import Shell
+from fz_manager.mods_manifest import ModsManifest
 from fz_manager.storage import Storage
 from fz_manager.titlebar import create_titlebar
-from fz_manager.utils import String, Term, Colors
-from fz_manager.utils import run_on_thread
+from fz_manager.utils import String, Term, Colors, RingBuffer, executor, run_on_thread, SCROLLBACK_LINES
 
 
 class Main:
@@ -22,22 +20,89 @@ class Main:
     def __init__(self) -> None:
         self.storage = Storage()
         self.client: (FZClient | None) = None
-        self.shell: (Shell | None) = None
+        self.shell = None
+        self.logs: RingBuffer[str] | None = None
+        self.archive: (LogArchive | None) = None
         self.titlebar = None
+        self.catalogs: (CatalogCache | None) = None
 
     async def main(self):
-        token = await self.choose_token()
-        if token is None:
-            return
-        self.client = FZClient(token if not String.isblank(token) else None)
-        self.shell = Shell(self.client, self.storage)
-        self.titlebar = create_titlebar(self.client)
-        asyncio.get_event_loop_policy().get_event_loop().create_task(self.client.connect())
+        token = None
+        self.client = await RemoteClient.attach(self.storage.daemon_socket_path)
+        self.archive = LogArchive(self.storage.logs_archive_path)
+        if self.client is None:
+            # Connect while the token is being typed, login follows as soon as it is entered
+            self.client = FZClient(await_token=True)
+            self.client.add_logs_listener(lambda log: self.archive.append(log, self.client.launch_id))
+        # Logs are buffered until the shell is first opened, see attach_to_server
+        self.logs = RingBuffer[str](self.storage.get('scrollback') or SCROLLBACK_LINES)
+        self.client.add_logs_listener(self.buffer_log)
+        loop = asyncio.get_event_loop_policy().get_event_loop()
+        loop.create_task(self.client.connect())
+        startup = None
+        try:
+            cached = False
+            if not isinstance(self.client, RemoteClient):
+                warm_up = loop.create_task(self.client.transport.warm())
+                token = await self.choose_token()
+                if token is None:
+                    warm_up.cancel()
+                    return
+                self.client.timer.mark('token')
+                self.client.set_token(token if not String.isblank(token) else None)
+                cached = self.seed_catalogs()
+            self.titlebar = create_titlebar(self.client)
+            startup = loop.create_task(self.finish_startup(token))
+            if cached:
+                # Menus are served from the cache meanwhile, only the login is awaited for the server status
+                await self.client.wait_for(lambda: self.client.connected)
+            else:
+                await startup
+            self.client.timer.mark('menu')
+            await self.main_menu()
+        finally:
+            if startup is not None:
+                startup.cancel()
+            if self.catalogs is not None:
+                self.catalogs.persist()
+            self.storage.persist()
+            await self.client.close()
+            self.archive.close()
+            await executor.shutdown()
+
+    def seed_catalogs(self) -> bool:
+        self.catalogs = CatalogCache(self.storage.catalog_cache_path)
+        self.catalogs.track(self.client)
+        if cached := self.catalogs.get(self.client.user_token):
+            self.client.seed(cached)
+        return bool(cached)
+
+    async def finish_startup(self, token: str | None):
         await self.client.wait_sync()
+        self.client.timer.mark('sync')
         self.storage.store('userToken', self.client.user_token)
         if token == '':
             self.storage.token_history.append_string(self.client.user_token)
-        await self.main_menu()
+        if self.catalogs is not None:
+            # Catalogs received before the login assigned a new token are not tracked yet
+            self.catalogs.put(self.client.user_token,
+                              **{c: self.client.state.get(c) for c in self.client.revalidated})
+            self.catalogs.persist()
+        await self.report_startup()
+        # On the loop thread, the store is not thread-safe and the menus may be storing answers meanwhile
+        self.storage.persist()
+
+    async def report_startup(self):
+        timer = self.client.timer
+        self.storage.store('startupTimings', {phase: round(elapsed, 3) for phase, elapsed in timer.marks.items()})
+        summary = timer.report()
+        if (menu := timer.between('token', 'menu' if 'menu' in timer.marks else 'sync')) is not None:
+            summary += f' (main menu {menu * 1000:.0f} ms after the token)'
+        await self.client.on_new_log(Term.debug('startup:', summary))
+
+    def stale_marker(self, *catalogs: str) -> str:
+        """Marker for menus showing catalogs from the cache that the server has not confirmed yet."""
+        return ' (cached)' if any(c in self.client.stale for c in catalogs) else ''
 
     # Main Menu
     async def main_menu(self):
@@ -167,60 +232,87 @@ class Main:
             size = path.getsize(file_path)
             mods.append(FZClient.Mod(name, file_path, size))
 
-        def callback(monitor):
-            progress.update(mod_task, completed=min(monitor.bytes_read, mod.size))
+        manifest = ModsManifest(self.storage.mods_manifest_path)
+        # Skipping needs the mods actually on the server, not the cached ones
+        await self.client.wait_for(lambda: 'mods' not in self.client.stale)
+        mods, skipped = await manifest.partition(mods, self.client.mods)
+        if not mods:
+            manifest.persist()
+            return await AlertMenu(f'All {len(skipped)} selected mods are already uploaded').show()
 
-        try:
-            with Progress() as progress:
-                main_task = progress.add_task('Uploading mods', total=len(mods))
-                for mod in mods:
-                    mod_task = progress.add_task(f'Uploading {mod.name}', total=mod.size)
-                    await self.client.upload_mod(mod, callback)
-                    progress.update(main_task, advance=1)
-
-        except BaseException as ex:
-            return await AlertMenu(str(ex) or ex.__class__.__name__).show()
+        limit = self.storage.get('uploadConcurrency') or UPLOAD_CONCURRENCY
+        from rich.progress import Progress
+        with Progress() as progress:
+            if skipped:
+                progress.print(f'Skipping {len(skipped)} already uploaded mods')
+            main_task = progress.add_task('Uploading mods', total=sum(m.size for m in mods))
+            mod_tasks = {m.filePath: progress.add_task(f'Uploading {m.name}', total=m.size, visible=False) for m in mods}
+            sent = {m.filePath: 0 for m in mods}
+
+            def callback(mod: FZClient.Mod, n_bytes: int):
+                progress.update(mod_tasks[mod.filePath], completed=n_bytes, visible=True)
+                progress.update(main_task, advance=n_bytes - sent[mod.filePath])
+                sent[mod.filePath] = n_bytes
+
+            def on_done(mod: FZClient.Mod, error: Exception | None):
+                progress.update(main_task, advance=mod.size - sent[mod.filePath])
+                progress.remove_task(mod_tasks[mod.filePath])
+                if error:
+                    progress.print(f'Failed {mod.name}: {str(error) or error.__class__.__name__}', style='red', markup=False)
+
+            results = await self.client.upload_mods(mods, callback, on_done, limit=limit)
+        await run_on_thread(manifest.mark_uploaded, *[mod for mod, error in results if not error])
+        manifest.persist()
+
+        failed = [mod.name for mod, error in results if error]
+        if failed:
+            return await AlertMenu(f'{len(failed)}/{len(mods)} mods failed to upload: {", ".join(failed)}').show()
 
     async def disable_mods_menu(self):
         if not self.client.mods or not len(self.client.mods):
             return await AlertMenu('No uploaded mods found', titlebar=self.titlebar).show()
 
         _, added, deselected = await CheckboxMenu(
-            message='Enable/Disable mods',
+            message='Enable/Disable mods' + self.stale_marker('mods'),
             entries=[MenuEntry(m['text'], pre_selected=m['enabled'], ext_index=m['id']) for m in self.client.mods],
             titlebar=self.titlebar
         ).show()
         if added is None or deselected is None:
             return
 
-        with Progress() as progress:
-            bar = progress.add_task('Applying changes', total=len(added) + len(deselected))
-            for e in added:
-                progress.print(f'Enabling {e.name}')
-                await self.client.toggle_mod(e.ext_index, True)
-                progress.update(bar, advance=1)
-            for e in deselected:
-                progress.print(f'Disabling {e.name}')
-                await self.client.toggle_mod(e.ext_index, False)
-                progress.update(bar, advance=1)
-            progress.remove_task(bar)
+        actions = [(e.ext_index, ModAction.ENABLE) for e in added] + \
+                  [(e.ext_index, ModAction.DISABLE) for e in deselected]
+        await self.apply_mod_actions('Applying changes', actions)
 
     async def delete_mods_menu(self):
         if not self.client.mods or not len(self.client.mods):
             return await AlertMenu('No uploaded mods found', titlebar=self.titlebar).show()
 
         selected, _, _ = await CheckboxMenu(
-            message='Delete mods',
+            message='Delete mods' + self.stale_marker('mods'),
             entries=[MenuEntry(m['text'], ext_index=m['id']) for m in self.client.mods],
             titlebar=self.titlebar
         ).show()
+        if not selected:
+            return
+        await self.apply_mod_actions('Deleting mods', [(e.ext_index, ModAction.DELETE) for e in selected])
+
+    async def apply_mod_actions(self, description: str, actions: list[tuple[int, str]]):
+        if not actions:
+            return
+        names = {m['id']: m['text'] for m in self.client.mods}
+        from rich.progress import Progress
         with Progress() as progress:
-            bar = progress.add_task('Deleting mods', total=len(selected))
-            for e in selected:
-                progress.print(f'Deleting {e.name}')
-                await self.client.delete_mod(e.ext_index)
+            bar = progress.add_task(description, total=len(actions))
+
+            def on_done(action: tuple[int, str], _):
                 progress.update(bar, advance=1)
-            progress.remove_task(bar)
+
+            results = await self.client.apply_mod_actions(actions, on_done)
+
+        failed = [f'{names.get(mod_id, mod_id)}: {error}' for (mod_id, _), error in results if error]
+        if failed:
+            await AlertMenu(f'{len(failed)}/{len(actions)} changes failed:\n' + '\n'.join(failed)).show()
 
     async def upload_save_menu(self):
         file_path = await PathMenu(
@@ -267,11 +359,12 @@ class Main:
 
         size = path.getsize(file_path)
         save = FZClient.Save(filename, file_path, size, slot_name)
+        from rich.progress import Progress
         with Progress() as progress:
             upload_task = progress.add_task(f'Uploading {filename}', total=size)
 
-            def callback(monitor):
-                progress.update(upload_task, completed=min(monitor.bytes_read, size))
+            def callback(n_bytes):
+                progress.update(upload_task, completed=n_bytes)
 
             try:
                 await self.client.upload_save(save, callback)
@@ -286,7 +379,7 @@ class Main:
             return await AlertMenu('All the slots are empty', titlebar=self.titlebar).show()
 
         selected, _, _ = await CheckboxMenu(
-            message='Select slots to delete:',
+            message='Select slots to delete:' + self.stale_marker('saves'),
             entries=entries,
             titlebar=self.titlebar
         ).show()
@@ -294,6 +387,7 @@ class Main:
         if not selected:
             return
 
+        from rich.progress import Progress
         with Progress() as progress:
             delete_task = progress.add_task(f'', total=len(selected))
             for slot in selected:
@@ -311,7 +405,7 @@ class Main:
             return await AlertMenu('All the slots are empty', titlebar=self.titlebar).show()
 
         selected, _, _ = await CheckboxMenu(
-            message='Select slots to download:',
+            message='Select slots to download:' + self.stale_marker('saves'),
             entries=entries,
             titlebar=self.titlebar
         ).show()
@@ -334,22 +428,34 @@ class Main:
         if not path.isdir(directory):
             return await AlertMenu(f'{directory} is not a directory').show()
 
+        slots = [(f'slot{slot.ext_index}', path.join(directory, f'slot{slot.ext_index}.zip')) for slot in selected]
+        limit = self.storage.get('downloadConcurrency') or DOWNLOAD_CONCURRENCY
+        from rich.progress import Progress
         with Progress() as progress:
-            download_task = progress.add_task(f'Downloading slots', total=len(selected))
-            for slot in selected:
-                expected_size = float(re.search('(\d+.\d+)MB', slot.name)[1]) * 1048576
-                slot_task = progress.add_task(f'Slot {slot.ext_index}', total=expected_size)
-
-                def update(n_bytes):
-                    progress.update(slot_task, completed=n_bytes)
-
-                slot_name = f'slot{slot.ext_index}'
-                try:
-                    await self.client.download_save_slot(slot_name, path.join(directory, f'slot{slot.ext_index}.zip'), update)
-                    progress.update(slot_task, completed=expected_size)
-                except Exception as ex:
-                    progress.print(ex)
-                progress.update(download_task, advance=1)
+            download_task = progress.add_task('Downloading slots', total=None)
+            slot_tasks = {name: progress.add_task(f'Slot {name[4:]}', total=None) for name, _ in slots}
+            received = {name: 0 for name, _ in slots}
+            totals = {}
+
+            def update(slot_name: str, n_bytes: int, total: int | None):
+                progress.update(slot_tasks[slot_name], completed=n_bytes, total=total)
+                received[slot_name] = n_bytes
+                if total:
+                    totals[slot_name] = total
+                progress.update(download_task, completed=sum(received.values()), total=sum(totals.values()) or None)
+
+            def on_done(slot: tuple[str, str], error: Exception | None):
+                if not error:
+                    progress.update(slot_tasks[slot[0]], total=received[slot[0]], completed=received[slot[0]])
+
+            results = await self.client.download_save_slots(slots, update, on_done, limit=limit)
+
+        downloaded = [file_path for (_, file_path), error in results if not error]
+        failed = [f'{slot_name}: {error}' for (slot_name, _), error in results if error]
+        summary = f'Downloaded {len(downloaded)}/{len(slots)} slots to {directory}'
+        if failed:
+            summary += '\nFailed:\n' + '\n'.join(failed)
+        await AlertMenu(summary).show()
 
     async def start_server(self):
         if (region := await self.choose_region(show_titlebar=True)) is None:
@@ -358,23 +464,31 @@ class Main:
             return
         if (slot := await self.choose_slot()) is None:
             return
+        from aioconsole import aprint
         await aprint('Starting instance...')
         self.client.add_logs_listener(aprint)
-        await run_on_thread(FZClient.start_instance, self.client, region, version, f'slot{slot}')
-        while not self.client.running and not self.client.server_address:
-            await asyncio.sleep(1)
+        await self.client.start_instance(region, version, f'slot{slot}')
+        await self.client.wait_for(lambda: self.client.running or self.client.server_address)
         self.client.remove_logs_listener(aprint)
         self.storage.persist()
 
     async def attach_to_server(self):
+        if self.shell is None:
+            from fz_manager.shell import Shell
+            self.client.remove_logs_listener(self.buffer_log)
+            self.shell = Shell(self.client, self.storage, self.archive, self.logs)
         await self.shell.show()
 
+    def buffer_log(self, log: str):
+        for line in log.split('\n'):
+            self.logs.append(line)
+
     async def stop_server(self):
+        from aioconsole import aprint
         await aprint('Stopping instance...')
         self.client.add_logs_listener(aprint)
-        await run_on_thread(FZClient.stop_instance, self.client)
-        while self.client.running:
-            await asyncio.sleep(1)
+        await self.client.stop_instance()
+        await self.client.wait_status(ServerStatus.OFFLINE)
         self.client.remove_logs_listener(aprint)
 
     async def get_remote_slots(self):
@@ -387,7 +501,7 @@ class Main:
         region = self.storage.get('region')
 
         region = await SelectMenu(
-            message='Choose a region:',
+            message='Choose a region:' + self.stale_marker('regions'),
             entries=[MenuEntry(f'{r[0]} - {r[1]}', ext_index=r[0]) for r in regions],
             default=region,
             titlebar=self.titlebar if show_titlebar else None
@@ -412,7 +526,7 @@ class Main:
     async def choose_factorio_version(self):
         version = self.storage.get('version')
         version = await SelectMenu(
-            message='Choose a Factorio version:',
+            message='Choose a Factorio version:' + self.stale_marker('versions'),
             entries=[MenuEntry(v, ext_index=v) for v in self.client.versions],
             default=version
         ).show()
@@ -425,7 +539,7 @@ class Main:
         slot = self.storage.get('slot')
         slots: list[str] = self.client.saves.values().mapping.values()
         slot = await SelectMenu(
-            message='Select slots to download:',
+            message='Select slots to download:' + self.stale_marker('saves'),
             entries=[MenuEntry(v, ext_index=i + 1) for i, v in enumerate(slots)],
             default=slot
         ).show()
@@ -9,7 +9,6 @@ from prompt_toolkit.output import ColorDepth
 
 def __inject__(question: questionary.Question, titlebar: Container, erase_when_done: bool):
     question.application.full_screen = True
-    question.application.refresh_interval = 1
     question.application._color_depth = ColorDepth.DEPTH_24_BIT
     question.application.erase_when_done = erase_when_done
     if titlebar:
@@ -19,6 +18,12 @@ def __inject__(question: questionary.Question, titlebar: Container, erase_when_d
 # noinspection PyProtectedMember
 async def load_last_answer(question):
     buffer = question.application.current_buffer
+    if latest := getattr(buffer.history, 'latest', None):
+        # Read from the tail of the history file, the rest loads when the prompt is shown
+        if (text := latest()) is not None:
+            buffer.text = text
+            buffer.cursor_position = len(text)
+        return
     buffer.load_history_if_not_yet_loaded()
     await buffer._load_history_task
     buffer.history_backward()
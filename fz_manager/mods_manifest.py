@@ -0,0 +1,74 @@
+import hashlib
+import json
+from os import path, stat
+
+from fz_manager.factorio_zone_api import FZClient, parse_mod_name
+from fz_manager.kvstore import atomic_write
+from fz_manager.utils import run_on_thread
+
+HASH_CHUNK_SIZE = 1048576
+
+
+class ModsManifest:
+    """
+    Persistent record of local mod content hashes, keyed by path, mtime and size,
+    and of the hash last uploaded for each mod file name.
+    """
+
+    def __init__(self, manifest_path: str):
+        self.manifest_path = manifest_path
+        self.files: dict[str, dict] = {}
+        self.uploaded: dict[str, str] = {}
+        self.load()
+
+    def load(self) -> None:
+        if not path.isfile(self.manifest_path):
+            return
+        try:
+            with open(self.manifest_path, 'r') as fp:
+                data = json.load(fp)
+            self.files = data.get('files', {})
+            self.uploaded = data.get('uploaded', {})
+        except (IOError, ValueError):
+            self.files = {}
+            self.uploaded = {}
+
+    def persist(self) -> None:
+        atomic_write(self.manifest_path, json.dumps({'files': self.files, 'uploaded': self.uploaded}).encode())
+
+    def digest(self, file_path: str) -> str:
+        st = stat(file_path)
+        entry = self.files.get(file_path)
+        if entry and entry['mtime'] == st.st_mtime_ns and entry['size'] == st.st_size:
+            return entry['sha1']
+        sha1 = hashlib.sha1()
+        with open(file_path, 'rb') as fp:
+            while chunk := fp.read(HASH_CHUNK_SIZE):
+                sha1.update(chunk)
+        self.files[file_path] = {'mtime': st.st_mtime_ns, 'size': st.st_size, 'sha1': sha1.hexdigest()}
+        return self.files[file_path]['sha1']
+
+    def mark_uploaded(self, *mods: FZClient.Mod) -> None:
+        for mod in mods:
+            self.uploaded[mod.name] = self.digest(mod.filePath)
+
+    def is_uploaded(self, mod: FZClient.Mod, remote_mods: list[dict]) -> bool:
+        name, version = parse_mod_name(mod.name)
+        for remote in remote_mods:
+            remote_name, remote_version = parse_mod_name(remote.get('name') or remote.get('text', ''))
+            if (remote_name, remote.get('version', remote_version)) != (name, version):
+                continue
+            if remote.get('size') is not None and int(remote['size']) != mod.size:
+                return False
+            last_upload = self.uploaded.get(mod.name)
+            return last_upload is None or last_upload == self.digest(mod.filePath)
+        return False
+
+    async def partition(self, mods: list[FZClient.Mod],
+                        remote_mods: list[dict]) -> tuple[list[FZClient.Mod], list[FZClient.Mod]]:
+        """Splits `mods` into the ones to upload and the ones already on the server."""
+        to_upload, skipped = [], []
+        for mod in mods:
+            uploaded = await run_on_thread(self.is_uploaded, mod, remote_mods)
+            (skipped if uploaded else to_upload).append(mod)
+        return to_upload, skipped
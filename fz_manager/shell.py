@@ -1,49 +1,134 @@
+import re
+import time
+from datetime import datetime
+from functools import lru_cache
+from itertools import islice
+from os import path
+
 from prompt_toolkit import Application
 from prompt_toolkit.buffer import Buffer
-from prompt_toolkit.formatted_text import fragment_list_to_text, to_formatted_text, ANSI
+from prompt_toolkit.data_structures import Point
+from prompt_toolkit.formatted_text import to_formatted_text, ANSI, StyleAndTextTuples
 from prompt_toolkit.key_binding import KeyBindings
 from prompt_toolkit.keys import Keys
 from prompt_toolkit.layout import Layout
-from prompt_toolkit.layout.containers import Window, HSplit, VSplit
-from prompt_toolkit.layout.controls import BufferControl, FormattedTextControl as FtC
-from prompt_toolkit.layout.processors import Processor, Transformation, TransformationInput
+from prompt_toolkit.filters import Condition
+from prompt_toolkit.layout.containers import Window, HSplit, VSplit, ConditionalContainer, WindowAlign
+from prompt_toolkit.layout.controls import BufferControl, FormattedTextControl as FtC, UIContent, UIControl
+from prompt_toolkit.mouse_events import MouseEvent, MouseEventType
 from prompt_toolkit.output import ColorDepth
 
+from fz_manager.console import CommandQueue, COMMAND_DEPTH
 from fz_manager.factorio_zone_api import FZClient
+from fz_manager.log_archive import LogArchive
+from fz_manager.log_filter import FilteredView, LogFilter
 from fz_manager.storage import Storage
 from fz_manager.titlebar import create_titlebar
-from fz_manager.utils import Colors, Term, run_on_thread
+from fz_manager.utils import Colors, Term, RingBuffer, run_on_thread, SCROLLBACK_LINES
 
 COMMAND_SYMBOL = '>_'
+FILTER_SYMBOL = 'filter:'
+RUN_SCRIPT_PREFIX = ':run '
+GREP_PREFIX = ':grep '
+LOGS_PREFIX = ':logs '
+ARCHIVE_MAX_RESULTS = 1000
+SCROLL_STEP = 3
+ANSI_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=ANSI_CACHE_SIZE)
+def parse_ansi(line: str) -> StyleAndTextTuples:
+    """Parses the ANSI escapes of a log line, merging adjacent characters sharing the same style."""
+    fragments: StyleAndTextTuples = []
+    for style, text, *_ in to_formatted_text(ANSI(line)):
+        if fragments and fragments[-1][0] == style:
+            fragments[-1] = (style, fragments[-1][1] + text)
+        else:
+            fragments.append((style, text))
+    return fragments
+
+
+class LogsControl(UIControl):
+    """
+    Renders the tail of a RingBuffer or FilteredView of log lines, scrolled `scroll_offset` lines up from the bottom.
+    Only the lines fitting the window are requested, and their ANSI parsing is cached across redraws.
+    """
+
+    def __init__(self, lines: RingBuffer[str] | FilteredView):
+        self.lines = lines
+        self.scroll_offset = 0
+        self.height = 0
 
+    def create_content(self, width: int, height: int) -> UIContent:
+        self.height = height
+        count = len(self.lines)
+        self.scroll_offset = max(0, min(self.scroll_offset, count - height))
+        first = max(0, count - height - self.scroll_offset)
+        visible = min(height, count)
 
-class FormatText(Processor):
-    def apply_transformation(self, ti: TransformationInput):
-        fragments = to_formatted_text(ANSI(fragment_list_to_text(ti.fragments)))
-        return Transformation(fragments)
+        def get_line(i: int):
+            return parse_ansi(self.lines[first + i])
+
+        return UIContent(get_line=get_line,
+                         line_count=visible,
+                         cursor_position=Point(0, max(visible - 1, 0)),
+                         show_cursor=False)
+
+    def on_line_added(self) -> None:
+        if self.scroll_offset:
+            self.scroll_offset += 1
+
+    def scroll(self, n_lines: int) -> None:
+        self.scroll_offset = max(0, min(self.scroll_offset + n_lines, len(self.lines) - self.height))
+
+    def mouse_handler(self, mouse_event: MouseEvent):
+        match mouse_event.event_type:
+            case MouseEventType.SCROLL_UP:
+                self.scroll(SCROLL_STEP)
+            case MouseEventType.SCROLL_DOWN:
+                self.scroll(-SCROLL_STEP)
+            case _:
+                return NotImplemented
+        return None
+
+    def is_focusable(self) -> bool:
+        return False
 
 
 class Shell:
-    def __init__(self, client: FZClient, storage: Storage):
+    def __init__(self, client: FZClient, storage: Storage, archive: LogArchive = None, logs: RingBuffer[str] = None):
         self.client = client
+        self.archive = archive
         self.commands_history = storage.command_history
-        self.logs_buffer = Buffer()
+        self.logs = logs if logs is not None else RingBuffer[str](storage.get('scrollback') or SCROLLBACK_LINES)
+        self.logs_control = LogsControl(self.logs)
+        self.filtered_logs = FilteredView(self.logs)
+        self.filtering = False
         self.command_buffer = Buffer(history=self.commands_history)
+        self.filter_buffer = Buffer(multiline=False, on_text_changed=self.on_filter_changed)
         self.app: Application | None = None
 
         command_kb = KeyBindings()
 
+        self.commands = CommandQueue(client,
+                                     self.on_command_result,
+                                     depth=storage.get('commandDepth') or COMMAND_DEPTH,
+                                     rate=storage.get('commandRate'))
+
         @command_kb.add(Keys.Enter)
         async def submit_command(_):
             command = self.command_buffer.text.strip()
             if not command:
                 return
+            self.command_buffer.reset(append_to_history=True)
+            if command.startswith(RUN_SCRIPT_PREFIX):
+                return await self.run_script(command[len(RUN_SCRIPT_PREFIX):].strip())
+            if command.startswith(GREP_PREFIX):
+                return await self.search_archive(pattern=command[len(GREP_PREFIX):].strip())
+            if command.startswith(LOGS_PREFIX):
+                return await self.search_archive(*command[len(LOGS_PREFIX):].split(maxsplit=2))
             self.push_log(Term.info('COMMAND:', command))
-            try:
-                self.command_buffer.reset(append_to_history=True)
-                await run_on_thread(FZClient.send_command, self.client, command)
-            except Exception as ex:
-                self.push_log(Term.error('Error:', str(ex)))
+            self.commands.submit(command)
 
         @command_kb.add(Keys.Up)
         def suggest_up(_):
@@ -59,11 +144,30 @@ class Shell:
                           focusable=True,
                           focus_on_click=True)
         )
+
+        filter_kb = KeyBindings()
+
+        @filter_kb.add(Keys.Escape, eager=True)
+        def clear_filter(_):
+            self.filter_buffer.reset()
+            self.filtering = False
+            self.layout.focus(command_window)
+
+        @filter_kb.add(Keys.Enter)
+        def apply_filter(_):
+            self.layout.focus(command_window)
+
+        self.filter_window = Window(BufferControl(self.filter_buffer, key_bindings=filter_kb, focus_on_click=True))
+        self.command_window = command_window
         self.layout = Layout(HSplit([
             create_titlebar(client),
-            Window(BufferControl(self.logs_buffer,
-                                 focusable=False,
-                                 input_processors=[FormatText()]), wrap_lines=False, style='bg:#212121'),
+            Window(self.logs_control, wrap_lines=False, style='bg:#212121'),
+            ConditionalContainer(VSplit([
+                Window(FtC(FILTER_SYMBOL), width=len(FILTER_SYMBOL) + 1, style=f'fg:{Colors.FACTORIO_FG_HEX} bold'),
+                self.filter_window,
+                Window(FtC(lambda: f'{len(self.filtered_logs)} matches' if self.filtered_logs.filter.active else ''),
+                       width=20, align=WindowAlign.RIGHT)
+            ], height=1, style=f'bg:{Colors.FACTORIO_BG_HEX}'), filter=Condition(lambda: self.filtering)),
             VSplit([
                 Window(FtC(COMMAND_SYMBOL), width=len(COMMAND_SYMBOL) + 1, style=f'fg:{Colors.FACTORIO_FG_HEX} bold'),
                 command_window
@@ -75,12 +179,67 @@ class Shell:
     def push_log(self, *log: str) -> None:
         if not log or len(log) == 0:
             return
-        text = ' '.join(log)
-        if self.logs_buffer.text:
-            self.logs_buffer.text += '\n' + text
+        for line in ' '.join(log).split('\n'):
+            self.logs.append(line)
+            if not self.filtered_logs.filter.active:
+                self.logs_control.on_line_added()
+            elif self.filtered_logs.on_line_added():
+                self.logs_control.on_line_added()
+        self.invalidate()
+
+    def on_filter_changed(self, _) -> None:
+        try:
+            log_filter = LogFilter(self.filter_buffer.text)
+        except re.error:
+            return
+        self.logs_control.scroll_offset = 0
+        if log_filter.active:
+            self.filtered_logs.set_filter(log_filter, self.invalidate)
+            self.logs_control.lines = self.filtered_logs
         else:
-            self.logs_buffer.text += text
-        self.logs_buffer.cursor_down(self.logs_buffer.document.line_count - self.logs_buffer.document.cursor_position_row)
+            self.filtered_logs.filter = log_filter
+            self.logs_control.lines = self.logs
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        if self.app and self.app.is_running:
+            self.app.invalidate()
+
+    def on_command_result(self, command: str, latency: float, error: Exception | None) -> None:
+        if error:
+            self.push_log(Term.error('Error:', command, f'({latency * 1000:.0f} ms)', str(error)))
+        else:
+            self.push_log(Term.debug('OK:', command, f'({latency * 1000:.0f} ms)'))
+
+    async def run_script(self, file_path: str) -> None:
+        if not path.isfile(file_path):
+            return self.push_log(Term.error('Error:', f'script {file_path} not found'))
+        self.push_log(Term.info('SCRIPT:', file_path))
+        start = time.monotonic()
+        try:
+            sent, failed = await self.commands.run_script(file_path)
+        except (OSError, UnicodeDecodeError) as ex:
+            return self.push_log(Term.error('Error:', f'script {file_path}: {str(ex) or ex.__class__.__name__}'))
+        summary = f'{sent} commands, {failed} failed in {time.monotonic() - start:.2f}s'
+        self.push_log((Term.error if failed else Term.info)('SCRIPT DONE:', summary))
+
+    async def search_archive(self, start: str = None, end: str = None, pattern: str = None) -> None:
+        """Prints the archived lines between the `start` and `end` ISO datetimes matching `pattern`."""
+        if not self.archive:
+            return self.push_log(Term.error('Error:', 'logs archive not available'))
+        try:
+            start_ts = datetime.fromisoformat(start).timestamp() if start else None
+            end_ts = datetime.fromisoformat(end).timestamp() if end else None
+            matches = await run_on_thread(lambda: list(islice(self.archive.query(start_ts, end_ts, pattern),
+                                                              ARCHIVE_MAX_RESULTS + 1)))
+        except (ValueError, re.error, OSError) as ex:
+            return self.push_log(Term.error('Error:', str(ex) or ex.__class__.__name__))
+        for ts, line in matches[:ARCHIVE_MAX_RESULTS]:
+            self.push_log(Term.debug(datetime.fromtimestamp(ts).isoformat(' ', 'seconds')), line)
+        summary = f'{min(len(matches), ARCHIVE_MAX_RESULTS)} archived lines'
+        if len(matches) > ARCHIVE_MAX_RESULTS:
+            summary += f' (first {ARCHIVE_MAX_RESULTS} shown)'
+        self.push_log(Term.info('ARCHIVE:', summary))
 
     async def show(self) -> None:
         app_kb = KeyBindings()
@@ -89,10 +248,25 @@ class Shell:
         def __exit(_):
             self.app.exit()
 
+        @app_kb.add(Keys.ControlF)
+        def __filter(_):
+            if self.filtering and self.layout.has_focus(self.filter_window):
+                self.layout.focus(self.command_window)
+            else:
+                self.filtering = True
+                self.layout.focus(self.filter_window)
+
+        @app_kb.add(Keys.PageUp)
+        def __page_up(_):
+            self.logs_control.scroll(max(self.logs_control.height - 1, 1))
+
+        @app_kb.add(Keys.PageDown)
+        def __page_down(_):
+            self.logs_control.scroll(-max(self.logs_control.height - 1, 1))
+
         self.app = Application(layout=self.layout,
                                full_screen=True,
                                color_depth=ColorDepth.DEPTH_24_BIT,
-                               refresh_interval=1,
                                mouse_support=True,
                                erase_when_done=True,
                                key_bindings=app_kb
@@ -0,0 +1,80 @@
+from types import MappingProxyType
+from typing import Any, Callable, Mapping
+
+
+class StateChange:
+    def __init__(self, key: str, old: Any, new: Any, version: int):
+        self.key = key
+        self.old = old
+        self.new = new
+        self.version = version
+
+    def __repr__(self):
+        return f'StateChange({self.key!r}, {self.old!r} -> {self.new!r}, v{self.version})'
+
+
+class StateSnapshot:
+    def __init__(self, version: int, values: dict[str, Any]):
+        self.version = version
+        self.values: Mapping[str, Any] = MappingProxyType(values)
+
+    def __getitem__(self, key: str) -> Any:
+        return self.values[key]
+
+    def diff(self, other: 'StateSnapshot') -> dict[str, tuple[Any, Any]]:
+        """Keys whose value differs in `other`, mapped to their (value in self, value in other)."""
+        return {k: (v, other.values.get(k)) for k, v in self.values.items() if other.values.get(k) != v}
+
+
+class ClientState:
+    """
+    Versioned store of the client state.
+    Values are replaced, never mutated in place, so snapshots are cheap shallow copies.
+    Every `update` bumping the version publishes one StateChange per modified key to the subscribers.
+    """
+
+    def __init__(self, **values: Any):
+        self.values: dict[str, Any] = dict(values)
+        self.version = 0
+        self.subscribers: list[tuple[Callable[[StateChange], None], frozenset[str]]] = []
+
+    def get(self, key: str) -> Any:
+        return self.values[key]
+
+    def update(self, **values: Any) -> list[StateChange]:
+        changed = {k: v for k, v in values.items() if self.values.get(k) != v}
+        if not changed:
+            return []
+        self.version += 1
+        changes = [StateChange(k, self.values.get(k), v, self.version) for k, v in changed.items()]
+        self.values.update(changed)
+        for listener, keys in list(self.subscribers):
+            for change in changes:
+                if not keys or change.key in keys:
+                    listener(change)
+        return changes
+
+    def subscribe(self, listener: Callable[[StateChange], None], *keys: str) -> None:
+        """Calls `listener` for changes of `keys`, or of every key if none is given."""
+        self.subscribers.append((listener, frozenset(keys)))
+
+    def unsubscribe(self, listener: Callable[[StateChange], None]) -> None:
+        self.subscribers = [s for s in self.subscribers if s[0] != listener]
+
+    def snapshot(self) -> StateSnapshot:
+        return StateSnapshot(self.version, dict(self.values))
+
+
+class StateField:
+    """Attribute of a class exposing a `state: ClientState`, read from and written to the store."""
+
+    def __set_name__(self, owner, name: str):
+        self.name = name
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        return obj.state.get(self.name)
+
+    def __set__(self, obj, value):
+        obj.state.update(**{self.name: value})
@@ -1,14 +1,14 @@
-import json
 import os
 import tempfile
-from os import path, umask
+from functools import cached_property
+from os import path
 
-from prompt_toolkit.history import FileHistory
+from fz_manager.kvstore import KeyValueStore
 
 
 class Storage:
-    def __init__(self):
-        self.temp_dir_path = path.join(tempfile.gettempdir(), '.fzm')
+    def __init__(self, root_path: str = None):
+        self.temp_dir_path = root_path or path.join(tempfile.gettempdir(), '.fzm')
         if path.exists(self.temp_dir_path):
             if not path.isdir(self.temp_dir_path):
                 raise RuntimeError(f'{self.temp_dir_path} path is occupied')
@@ -20,35 +20,43 @@ class Storage:
         self.token_history_path = path.join(self.temp_dir_path, '.fzm_token_history')
         self.mods_path_history_path = path.join(self.temp_dir_path, '.fzm_mods_path_history')
         self.saves_path_history_path = path.join(self.temp_dir_path, '.fzm_saves_path_history')
+        self.catalog_cache_path = path.join(self.temp_dir_path, '.fzm_catalogs')
+        self.mods_manifest_path = path.join(self.temp_dir_path, '.fzm_mods_manifest')
+        self.logs_archive_path = path.join(self.temp_dir_path, 'logs')
+        self.daemon_socket_path = path.join(self.temp_dir_path, '.fzm_daemon.sock')
 
-        self.command_history = FileHistory(self.command_history_path)
-        self.token_history = FileHistory(self.token_history_path)
-        self.mods_path_history = FileHistory(self.mods_path_history_path)
-        self.saves_path_history = FileHistory(self.saves_path_history_path)
-        self.in_mem_store: dict[str, (str | int)] | None = None
-        self.load()
+        self.kv_store = KeyValueStore(self.store_path)
 
-    def store(self, key: str, value: (str | int)):
-        self.in_mem_store[key] = value
+    # Histories are created on first use, most runs only need the token one
+    @cached_property
+    def command_history(self):
+        return self._history(self.command_history_path)
 
-    def get(self, key: str) -> (str | int | None):
-        return self.in_mem_store.get(key)
+    @cached_property
+    def token_history(self):
+        return self._history(self.token_history_path)
+
+    @cached_property
+    def mods_path_history(self):
+        return self._history(self.mods_path_history_path)
+
+    @cached_property
+    def saves_path_history(self):
+        return self._history(self.saves_path_history_path)
+
+    def _history(self, file_path: str):
+        from fz_manager.history import CappedFileHistory, HISTORY_MAX_ENTRIES
+        return CappedFileHistory(file_path, self.get('historySize') or HISTORY_MAX_ENTRIES)
+
+    def store(self, key: str, value):
+        self.kv_store.set(key, value)
+
+    def get(self, key: str):
+        return self.kv_store.get(key)
 
     def persist(self) -> None:
-        pre_umask = umask(77)
-        try:
-            with open(self.store_path, 'w') as fp:
-                json.dump(self.in_mem_store, fp)
-        finally:
-            umask(pre_umask)
+        """Writes the keys stored since the last call."""
+        self.kv_store.persist()
 
     def load(self) -> None:
-        if path.exists(self.store_path) and path.isfile(self.store_path):
-            try:
-                with open(self.store_path, 'r') as fp:
-                    self.in_mem_store = dict()
-                    self.in_mem_store.update(json.load(fp))
-            except IOError as e:
-                print(e)
-        else:
-            self.in_mem_store = dict()
+        self.kv_store.load()
@@ -1,33 +1,41 @@
 from prompt_toolkit.application import get_app
-from prompt_toolkit.formatted_text import merge_formatted_text, to_formatted_text
-from prompt_toolkit.layout.containers import Container, DynamicContainer, Window
+from prompt_toolkit.formatted_text import StyleAndTextTuples, to_formatted_text
+from prompt_toolkit.layout.containers import Window
 from prompt_toolkit.layout.controls import FormattedTextControl
 
 from fz_manager.factorio_zone_api import FZClient
 from fz_manager.utils import Colors
 
 
-def create_titlebar(client: FZClient = None) -> DynamicContainer:
-    def get_content() -> Container:
-        app = get_app()
+def create_titlebar(client: FZClient = None) -> Window:
+    """
+    The title text is rebuilt only when the server status, its address, the cached catalogs or the terminal width change.
+    Changes of those in the client state invalidate the running application, so no periodic refresh is needed.
+    """
+    cache: dict[str, tuple | StyleAndTextTuples] = {'key': None, 'text': []}
+
+    def get_text() -> StyleAndTextTuples:
+        total_width = get_app().output.get_size().columns
+        key = (client.server_status, client.server_address, tuple(client.stale), total_width) if client \
+            else (None, None, (), total_width)
+        if key == cache['key']:
+            return cache['text']
+
         title = 'Factorio Zone Manager '
+        if client and client.stale:
+            title += f'[cached {", ".join(client.stale)}, refreshing] '
         if client and client.server_address:
             server_info = f'Server {client.server_status} at: {client.server_address} '
         else:
             server_info = ' '
+        padding_size = total_width - len(title) - len(server_info)
+        cache['key'] = key
+        cache['text'] = to_formatted_text(title, 'bold') + [('', ' ' * padding_size), ('', server_info)]
+        return cache['text']
 
-        used_width = len(title) + len(server_info)
-        total_width = app.output.get_size().columns
-        padding_size = total_width - used_width
-        padding = to_formatted_text(' ' * padding_size)
-
-        return Window(FormattedTextControl(
-            merge_formatted_text(
-                to_formatted_text([
-                    to_formatted_text(title, 'bold'),
-                    padding, server_info
-                ])),
-            style=f'bg:{Colors.FACTORIO_BG_HEX} fg:{Colors.FACTORIO_FG_HEX}'),
-            height=1)
+    if client:
+        client.state.subscribe(lambda _: get_app().invalidate(), 'server_status', 'server_address', 'stale')
 
-    return DynamicContainer(get_content)
+    return Window(FormattedTextControl(get_text),
+                  style=f'bg:{Colors.FACTORIO_BG_HEX} fg:{Colors.FACTORIO_FG_HEX}',
+                  height=1)
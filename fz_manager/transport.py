@@ -0,0 +1,212 @@
+import asyncio
+import importlib
+import json
+import os
+import uuid
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, AsyncIterator, Callable
+
+from fz_manager.utils import run_on_thread
+
+if TYPE_CHECKING:
+    import aiohttp
+
+UPLOAD_CHUNK_SIZE = 65536
+DOWNLOAD_MIN_BUFFER = 65536
+DOWNLOAD_MAX_BUFFER = 4194304
+DOWNLOAD_RETRIES = 5
+DOWNLOAD_READ_TIMEOUT = 60  # seconds without data before a download is considered stalled and retried
+RETRY_MAX_DELAY = 30
+CONNECT_TIMEOUT = 30
+
+
+class Response:
+    def __init__(self, status_code: int, text: str):
+        self.status_code = status_code
+        self.text = text
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class Transport:
+    """
+    Asyncio HTTP transport owning a single keep-alive connection pool.
+    Every call is awaitable, so the websocket receive loop keeps running while requests are in flight.
+    aiohttp is imported with the first request, keeping it off the startup path.
+    """
+
+    def __init__(self, endpoint: str, pool_size: int = 8):
+        self.base_url = f'https://{endpoint}'
+        self.pool_size = pool_size
+        self.session: 'aiohttp.ClientSession | None' = None
+
+    def _get_session(self) -> 'aiohttp.ClientSession':
+        if self.session is None or self.session.closed:
+            import aiohttp
+            self.session = aiohttp.ClientSession(
+                base_url=self.base_url,
+                connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=CONNECT_TIMEOUT)
+            )
+        return self.session
+
+    async def warm(self) -> None:
+        """Imports aiohttp and opens a pooled connection ahead of the first request, ignoring failures."""
+        await run_on_thread(importlib.import_module, 'aiohttp')
+        import aiohttp
+        try:
+            async with self._get_session().head('/', timeout=aiohttp.ClientTimeout(total=10)):
+                pass
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            pass
+
+    async def post(self, url: str, data: dict = None, timeout: float = None) -> Response:
+        async with self.stream(url, data, timeout=timeout) as resp:
+            return Response(resp.status, await resp.text())
+
+    @asynccontextmanager
+    async def stream(self, url: str,
+                     data: dict | AsyncIterator[bytes] = None,
+                     headers: dict = None,
+                     timeout: float = None,
+                     read_timeout: float = None) -> AsyncIterator['aiohttp.ClientResponse']:
+        import aiohttp
+        # Without timeouts the session default applies, passing None would disable its connect timeout too
+        options = {}
+        if timeout or read_timeout:
+            options['timeout'] = aiohttp.ClientTimeout(total=timeout, sock_connect=CONNECT_TIMEOUT,
+                                                       sock_read=read_timeout)
+        async with self._get_session().post(url, data=_stringify(data), headers=headers, **options) as resp:
+            yield resp
+
+    async def upload(self, url: str,
+                     fields: dict,
+                     file_field: str,
+                     file_name: str,
+                     file_path: str,
+                     content_type: str,
+                     cb: Callable[[int], None] = None,
+                     timeout: float = None) -> Response:
+        """
+        Streams a multipart/form-data body reading the file in chunks.
+        `cb` receives the number of file bytes sent so far.
+        """
+        boundary = uuid.uuid4().hex
+        parts: list[bytes | None] = []
+        for name, value in fields.items():
+            if name == file_field:
+                parts.append(_part_header(boundary, name, file_name, content_type))
+                parts.append(None)
+                parts.append(b'\r\n')
+            else:
+                parts.append(_part_header(boundary, name) + str(value).encode() + b'\r\n')
+        parts.append(f'--{boundary}--\r\n'.encode())
+        file_size = os.path.getsize(file_path)
+        length = sum(len(p) for p in parts if p is not None) + file_size
+
+        async def body() -> AsyncIterator[bytes]:
+            with open(file_path, 'rb') as file:
+                for part in parts:
+                    if part is not None:
+                        yield part
+                        continue
+                    sent = 0
+                    while chunk := await run_on_thread(file.read, UPLOAD_CHUNK_SIZE):
+                        yield chunk
+                        sent += len(chunk)
+                        if cb:
+                            cb(sent)
+
+        headers = {
+            'Content-Type': f'multipart/form-data; boundary={boundary}',
+            'Content-Length': str(length)
+        }
+        async with self.stream(url, body(), headers=headers, timeout=timeout) as resp:
+            return Response(resp.status, await resp.text())
+
+    async def download(self, url: str,
+                       data: dict,
+                       file_path: str,
+                       cb: Callable[[int, int | None], None] = None,
+                       retries: int = DOWNLOAD_RETRIES,
+                       read_timeout: float = DOWNLOAD_READ_TIMEOUT) -> int:
+        """
+        Downloads into `file_path + '.part'` and renames it to `file_path` once complete.
+        Dropped connections and reads stalled for `read_timeout` seconds are retried with backoff,
+        resuming with a Range request when the server advertises `Accept-Ranges: bytes`.
+        `cb` receives the bytes written and the total size taken from the response headers, if known.
+        """
+        import aiohttp
+        part_path = file_path + '.part'
+        received = 0
+        total = None
+        resumable = False
+        attempt = 0
+        try:
+            with open(part_path, 'wb') as file:
+                while True:
+                    headers = {'Range': f'bytes={received}-'} if resumable and received else None
+                    try:
+                        async with self.stream(url, data, headers=headers, read_timeout=read_timeout) as resp:
+                            if resp.status not in (200, 206):
+                                raise Exception(f'{resp.status} {await resp.text()}')
+                            if resp.status == 200 and received:
+                                file.seek(0)
+                                file.truncate()
+                                received = 0
+                            resumable = resp.status == 206 or resp.headers.get('Accept-Ranges') == 'bytes'
+                            total = _content_total(resp) or total
+                            buffer_size = DOWNLOAD_MIN_BUFFER
+                            while chunk := await resp.content.read(buffer_size):
+                                file.write(chunk)
+                                received += len(chunk)
+                                if cb:
+                                    cb(received, total)
+                                if len(chunk) == buffer_size:
+                                    buffer_size = min(buffer_size * 2, DOWNLOAD_MAX_BUFFER)
+                        if total is None or received >= total:
+                            break
+                        raise aiohttp.ClientPayloadError(f'Connection closed after {received} of {total} bytes')
+                    except (aiohttp.ClientError, asyncio.TimeoutError):
+                        attempt += 1
+                        if attempt > retries:
+                            raise
+                        await asyncio.sleep(min(2 ** attempt, RETRY_MAX_DELAY))
+        except BaseException:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+        os.replace(part_path, file_path)
+        return received
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+
+def _stringify(data):
+    if not isinstance(data, dict):
+        return data
+    return {k: str(v) for k, v in data.items() if v is not None}
+
+
+def _content_total(resp: 'aiohttp.ClientResponse') -> int | None:
+    if content_range := resp.headers.get('Content-Range'):
+        total = content_range.rpartition('/')[2]
+        return int(total) if total.isdigit() else None
+    return resp.content_length
+
+
+def _part_header(boundary: str, name: str, file_name: str = None, content_type: str = None) -> bytes:
+    header = f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"'
+    if file_name is not None:
+        header += f'; filename="{file_name}"'
+    if content_type is not None:
+        header += f'\r\nContent-Type: {content_type}'
+    return (header + '\r\n\r\n').encode()
+
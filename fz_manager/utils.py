@@ -1,7 +1,15 @@
 import asyncio
+import functools
 import inspect
 import os
-import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Generic, Iterable, Iterator, TypeVar
+
+T = TypeVar('T')
+
+EXECUTOR_WORKERS = 8
+SCROLLBACK_LINES = 100000
 
 
 class Term:
@@ -79,35 +87,129 @@ class String:
         return string is None or string.strip() == ''
 
 
-class Thread(threading.Thread):
-    def __init__(self, group=None, target=None, name=None, args=(), kwargs=None):
-        self._target = target
-        self._args = args
-        if kwargs is None:
-            kwargs = {}
-        self._kwargs = kwargs
-        self._return = None
-        super().__init__(group, target, name, args, kwargs)
-        self._alive = True
-
-    def run(self):
-        if self._target is not None:
-            self._return = self._target(*self._args, **self._kwargs)
-            if inspect.iscoroutinefunction(self._target):
-                self._return = asyncio.run(self._return)
-        self._alive = False
-
-    def join(self, **kwargs) -> any:
-        super().join(**kwargs)
-        return self._return
-
-    def is_alive(self) -> bool:
-        return self._alive
-
-
-async def run_on_thread(fn, *args):
-    t = Thread(target=fn, args=args)
-    t.start()
-    while t.is_alive():
-        await asyncio.sleep(0.5)
-    return t.join()
+class RingBuffer(Generic[T]):
+    """
+    Fixed capacity sequence with O(1) append and indexing, evicting the oldest item when full.
+    `total` counts every item ever appended, so `first_index` is the absolute index of `self[0]`.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.items: list[T | None] = [None] * capacity
+        self.start = 0
+        self.count = 0
+        self.total = 0
+
+    def append(self, item: T) -> T | None:
+        """Appends `item`, returning the evicted one if the buffer was full."""
+        evicted = None
+        end = (self.start + self.count) % self.capacity
+        if self.count == self.capacity:
+            evicted = self.items[end]
+            self.start = (self.start + 1) % self.capacity
+        else:
+            self.count += 1
+        self.items[end] = item
+        self.total += 1
+        return evicted
+
+    @property
+    def first_index(self) -> int:
+        return self.total - self.count
+
+    def clear(self) -> None:
+        self.items = [None] * self.capacity
+        self.start = 0
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index: int) -> T:
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError('RingBuffer index out of range')
+        return self.items[(self.start + index) % self.capacity]
+
+    def __iter__(self) -> Iterator[T]:
+        for i in range(self.count):
+            yield self.items[(self.start + i) % self.capacity]
+
+
+class PhaseTimer:
+    """Seconds elapsed from creation to the first time each named phase is reached."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.marks: dict[str, float] = {}
+
+    def mark(self, phase: str) -> None:
+        self.marks.setdefault(phase, time.perf_counter() - self.start)
+
+    def between(self, first: str, last: str) -> float | None:
+        if first not in self.marks or last not in self.marks:
+            return None
+        return self.marks[last] - self.marks[first]
+
+    def report(self) -> str:
+        return ', '.join(f'{phase} {elapsed * 1000:.0f} ms' for phase, elapsed in
+                         sorted(self.marks.items(), key=lambda m: m[1]))
+
+
+class Executor:
+    """
+    Bounded thread pool running blocking work for the event loop.
+    `run` returns an awaitable whose cancellation also cancels the work if it has not started yet.
+    """
+
+    def __init__(self, max_workers: int = EXECUTOR_WORKERS):
+        self.max_workers = max_workers
+        self.pool: ThreadPoolExecutor | None = None
+
+    def submit(self, fn: Callable, *args, **kwargs) -> asyncio.Future:
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix='fzm')
+        if inspect.iscoroutinefunction(fn):
+            fn, args = _run_coroutine, (fn, *args)
+        return asyncio.get_running_loop().run_in_executor(self.pool, functools.partial(fn, *args, **kwargs))
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        return await self.submit(fn, *args, **kwargs)
+
+    async def shutdown(self, cancel_futures: bool = True) -> None:
+        """Drops the queued work and waits for the running one to complete."""
+        if self.pool is not None:
+            pool, self.pool = self.pool, None
+            await asyncio.to_thread(pool.shutdown, True, cancel_futures=cancel_futures)
+
+
+def _run_coroutine(fn, *args, **kwargs):
+    return asyncio.run(fn(*args, **kwargs))
+
+
+executor = Executor()
+
+
+async def run_on_thread(fn, *args, **kwargs):
+    return await executor.run(fn, *args, **kwargs)
+
+
+async def run_bounded(items: Iterable[T],
+                      fn: Callable[[T], Awaitable],
+                      limit: int,
+                      on_done: Callable[[T, Exception | None], None] = None) -> list[tuple[T, Exception | None]]:
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(item: T):
+        async with semaphore:
+            try:
+                await fn(item)
+                error = None
+            except Exception as ex:
+                error = ex
+        if on_done:
+            on_done(item, error)
+        return item, error
+
+    return list(await asyncio.gather(*[run(item) for item in items]))
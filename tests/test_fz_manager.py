@@ -1,5 +1,641 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from contextlib import asynccontextmanager
+from os import path
+from types import SimpleNamespace
+
+import aiohttp
+import pytest
+
 from fz_manager import __version__
+from fz_manager import transport as transport_module
+from fz_manager.catalog_cache import CatalogCache
+from fz_manager.cli import EXIT_FAILURE, Cli, create_parser
+from fz_manager.console import CommandQueue
+from fz_manager.daemon import Daemon, RemoteClient
+from fz_manager.dispatch import Backpressure, LogsIndex, LogsQueue
+from fz_manager.factorio_zone_api import FZClient, ModAction, ServerStatus
+from fz_manager.history import COMPACT_INTERVAL, CappedFileHistory
+from fz_manager.kvstore import KeyValueStore
+from fz_manager.log_archive import LogArchive
+from fz_manager.log_filter import FilteredView, LogFilter
+from fz_manager.mods_manifest import ModsManifest
+from fz_manager.shell import Shell
+from fz_manager.storage import Storage
+from fz_manager.transport import Transport
+from fz_manager.utils import Executor, RingBuffer, Term, executor, run_bounded
 
 
 def test_version():
     assert __version__ == '0.1.0'
+
+
+def test_entry_point_defers_heavy_imports():
+    script = 'import sys, fz_manager.cli, fz_manager.main; print(sorted(m for m in sys.modules if m in %r))'
+    deferred = ('aiohttp', 'rich', 'aioconsole', 'fz_manager.shell')
+    out = subprocess.run([sys.executable, '-c', script % (deferred,)], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == '[]'
+
+
+def test_mods_manifest_skips_unchanged_uploaded_mods(tmp_path):
+    mod_path = tmp_path / 'rails_1.2.3.zip'
+    mod_path.write_bytes(b'rails')
+    mod = FZClient.Mod(mod_path.name, str(mod_path), 5)
+    manifest = ModsManifest(str(tmp_path / 'manifest'))
+    remote = [{'id': 1, 'text': 'rails_1.2.3.zip', 'enabled': True}]
+
+    assert asyncio.run(manifest.partition([mod], [])) == ([mod], [])
+    assert asyncio.run(manifest.partition([mod], remote)) == ([], [mod])
+
+    manifest.mark_uploaded(mod)
+    manifest.persist()
+    mtime_ns = mod_path.stat().st_mtime_ns
+    mod_path.write_bytes(b'trams')
+    # Same size, the new mtime alone must invalidate the cached hash even on coarse timestamp filesystems
+    os.utime(mod_path, ns=(mtime_ns + 1_000_000_000, mtime_ns + 1_000_000_000))
+    manifest = ModsManifest(str(tmp_path / 'manifest'))
+    assert asyncio.run(manifest.partition([mod], remote)) == ([mod], [])
+
+
+class FakeDownload:
+    """Scripted responses for Transport.download: (status, headers, chunks), an exception in chunks drops the link."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+        self.read_timeout = None
+
+    @asynccontextmanager
+    async def stream(self, url, data, headers=None, read_timeout=None):
+        self.requests.append(headers)
+        self.read_timeout = read_timeout
+        status, response_headers, chunks = self.responses.pop(0)
+
+        class Content:
+            async def read(self, _):
+                if not chunks:
+                    return b''
+                if isinstance(chunk := chunks.pop(0), Exception):
+                    raise chunk
+                return chunk
+
+        yield SimpleNamespace(status=status, headers=response_headers, content=Content(),
+                              content_length=int(response_headers.get('Content-Length', 0)) or None)
+
+
+def download(tmp_path, monkeypatch, fake, retries=2):
+    monkeypatch.setattr(transport_module, 'RETRY_MAX_DELAY', 0)
+    transport = Transport('example.invalid')
+    transport.stream = fake.stream
+    return asyncio.run(transport.download('/save', {}, str(tmp_path / 'slot1.zip'), retries=retries))
+
+
+def test_download_resumes_with_range_requests(tmp_path, monkeypatch):
+    fake = FakeDownload(
+        (200, {'Accept-Ranges': 'bytes', 'Content-Length': '10'}, [b'0123', aiohttp.ClientPayloadError('drop')]),
+        (206, {'Content-Range': 'bytes 4-9/10'}, [b'45', asyncio.TimeoutError()]),
+        (206, {'Content-Range': 'bytes 6-9/10'}, [b'6789']),
+    )
+    assert download(tmp_path, monkeypatch, fake) == 10
+    assert (tmp_path / 'slot1.zip').read_bytes() == b'0123456789'
+    assert fake.requests == [None, {'Range': 'bytes=4-'}, {'Range': 'bytes=6-'}]
+    assert fake.read_timeout == transport_module.DOWNLOAD_READ_TIMEOUT
+
+
+def test_download_restarts_when_the_range_is_ignored(tmp_path, monkeypatch):
+    fake = FakeDownload(
+        (200, {'Accept-Ranges': 'bytes', 'Content-Length': '6'}, [b'abc', aiohttp.ClientPayloadError('drop')]),
+        (200, {'Content-Length': '6'}, [b'abcdef']),
+    )
+    assert download(tmp_path, monkeypatch, fake) == 6
+    assert (tmp_path / 'slot1.zip').read_bytes() == b'abcdef'
+
+
+def test_download_gives_up_after_retries_and_removes_the_part_file(tmp_path, monkeypatch):
+    fake = FakeDownload(*[(200, {'Content-Length': '6'}, [b'abc', aiohttp.ClientPayloadError('drop')])] * 3)
+    with pytest.raises(aiohttp.ClientPayloadError):
+        download(tmp_path, monkeypatch, fake, retries=2)
+    assert len(fake.requests) == 3 and not fake.responses
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_run_bounded_limits_concurrency_and_isolates_failures():
+    running = []
+    peak = []
+
+    async def work(n):
+        running.append(n)
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        running.remove(n)
+        if n == 3:
+            raise ValueError(n)
+
+    results = asyncio.run(run_bounded(range(8), work, 2))
+    assert max(peak) == 2
+    assert [n for n, error in results if error] == [3]
+
+
+def test_apply_mod_actions_resolves_after_mods_broadcast():
+    client = FZClient()
+    client.mods = [{'id': 1, 'text': 'a', 'enabled': False}, {'id': 2, 'text': 'b', 'enabled': True}]
+
+    async def toggle_mod(mod_id, enabled):
+        if mod_id == 3:
+            raise Exception('unknown mod')
+        client.mods = [{**m, 'enabled': enabled} if m['id'] == mod_id else m for m in client.mods]
+
+    async def delete_mod(mod_id):
+        client.mods = [m for m in client.mods if m['id'] != mod_id]
+
+    client.toggle_mod = toggle_mod
+    client.delete_mod = delete_mod
+    actions = [(1, ModAction.ENABLE), (2, ModAction.DELETE), (3, ModAction.DISABLE)]
+    results = asyncio.run(client.apply_mod_actions(actions, timeout=5))
+    assert [str(error) for _, error in results] == ['None', 'None', 'unknown mod']
+    assert client.mods == [{'id': 1, 'text': 'a', 'enabled': True}]
+
+
+def test_upload_mods_waits_for_every_upload_to_be_listed():
+    client = FZClient()
+    client.mods = []
+
+    async def upload_mod(mod, cb):
+        if mod.name == 'broken_1.0.0.zip':
+            client.mods_sync = True
+            raise Exception('rejected')
+
+    async def broadcast(*names):
+        for n, name in enumerate(names):
+            await asyncio.sleep(0.05)
+            client.handlers['mods']({'type': 'mods', 'mods': [*client.mods, {'id': n, 'text': name, 'enabled': True}]})
+            await client.notify_state_changed()
+
+    async def run(names, listed, timeout):
+        mods = [FZClient.Mod(name, name, 1) for name in names]
+        asyncio.create_task(broadcast(*listed))
+        start = time.monotonic()
+        results = await client.upload_mods(mods, timeout=timeout)
+        return [str(error) for _, error in results], time.monotonic() - start
+
+    async def scenarios():
+        errors, elapsed = await run(['first_1.0.0.zip', 'broken_1.0.0.zip', 'second_2.1.0.zip'],
+                                    ['first_1.0.0.zip', 'second_2.1.0.zip'], timeout=5)
+        assert errors == ['None', 'rejected', 'None'] and elapsed < 1
+        errors, _ = await run(['third_1.0.0.zip', 'lost_1.0.0.zip'], ['third_1.0.0.zip'], timeout=0.2)
+        assert errors == ['None', 'Upload not confirmed by server']
+
+    client.upload_mod = upload_mod
+    asyncio.run(scenarios())
+
+
+def test_failing_logs_listener_is_reported_to_the_others():
+    client = FZClient()
+    received = []
+
+    def broken(log):
+        raise ValueError('boom')
+
+    client.add_logs_listener(broken)
+    client.add_logs_listener(received.append)
+    asyncio.run(client.deliver_log('line'))
+    assert received[-1] == 'line'
+    assert any('ValueError: boom' in log for log in received[:-1])
+
+
+def test_daemon_shares_session_with_attached_clients(tmp_path):
+    socket_path = str(tmp_path / 'fzm.sock')
+
+    async def run():
+        client = FZClient('token')
+        client.visit_secret = 'secret'
+        frames = asyncio.Queue()
+
+        async def connect():
+            while True:
+                data = await frames.get()
+                if (result := client.handlers[data['type']](data)) is not None:
+                    await result
+
+        client.connect = connect
+        daemon = Daemon(client, socket_path)
+        serving = asyncio.create_task(daemon.serve())
+        await frames.put({'type': 'log', 'num': 1, 'line': 'before'})
+        while not path.exists(socket_path):
+            await asyncio.sleep(0.01)
+
+        remote = await RemoteClient.attach(socket_path)
+        logs = []
+        remote.add_logs_listener(logs.append)
+        attached = asyncio.create_task(remote.connect())
+        await remote.wait_for(lambda: remote.visit_secret == 'secret', timeout=5)
+        await frames.put({'type': 'mods', 'mods': [{'id': 1, 'text': 'a', 'enabled': True}]})
+        await frames.put({'type': 'log', 'num': 2, 'line': 'after'})
+        await remote.wait_mods_sync(timeout=5)
+        while len(logs) < 2:
+            await asyncio.sleep(0.01)
+
+        assert remote.user_token == 'token' and remote.mods == client.mods
+        assert logs == ['before', 'after']
+        # Stopping does not wait for attached clients to detach, they see the connection closed
+        daemon.stop()
+        await asyncio.wait_for(serving, timeout=5)
+        await asyncio.wait_for(attached, timeout=5)
+        assert not remote.connected
+        await remote.close()
+
+    asyncio.run(run())
+    assert asyncio.run(RemoteClient.attach(socket_path)) is None
+
+
+def test_cli_download_saves_emits_events_and_exit_code(tmp_path, capsys):
+    client = FZClient()
+    client.saves = {'slot1': 'world', 'slot2': 'slot 2 (empty)', 'slot3': 'other'}
+
+    async def download_save_slot(slot, file_path, cb):
+        if slot == 'slot3':
+            raise Exception('gone')
+        cb(5, 5)
+
+    client.download_save_slot = download_save_slot
+    cli = Cli(storage=None)
+    cli.client = client
+    args = create_parser().parse_args(['saves', 'download', '--all', str(tmp_path), '--concurrency', '1'])
+    assert asyncio.run(args.handler(cli, args)) == EXIT_FAILURE
+
+    events = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [e['event'] for e in events] == ['progress', 'downloaded', 'failed', 'done']
+    assert events[0]['done'] == events[0]['total'] == 5
+    assert events[2]['slot'] == 'slot3' and events[2]['message'] == 'gone'
+    assert events[3]['downloaded'] == 1 and events[3]['failed'] == 1
+
+
+def test_login_waits_for_token_without_blocking_frames():
+    async def run():
+        client = FZClient(await_token=True)
+        logins = []
+
+        async def login(reconnected=False):
+            logins.append((client.user_token, client.visit_secret))
+
+        client.login = login
+        assert client.handlers['visit']({'type': 'visit', 'secret': 's'}) is None
+        client.handlers['mods']({'type': 'mods', 'mods': []})
+        await asyncio.sleep(0)
+        assert client.mods_sync and not logins and not client.connected
+
+        client.set_token('token')
+        await client.wait_for(lambda: client.connected, timeout=5)
+        assert logins == [('token', 's')]
+        assert list(client.timer.marks) == ['visit', 'login']
+        await client.close()
+
+    asyncio.run(run())
+
+
+def test_connect_skips_bad_frames_and_reconnects_with_backoff(monkeypatch):
+    sleep = asyncio.sleep
+    delays = []
+
+    async def fake_sleep(delay, *args):
+        delays.append(delay)
+        await sleep(0)
+
+    async def run():
+        client = FZClient('token')
+        logins, logs = [], []
+        connections = [
+            ['{"type": "visit", "secret": "s1"}', 'not json', '{"secret": "no type"}', OSError('reset')],
+            OSError('refused'),
+            ['{"type": "visit", "secret": "s2"}', '{"type": "mods", "mods": []}'],
+        ]
+
+        class Socket:
+            def __init__(self, frames):
+                self.frames = frames
+
+            async def recv(self):
+                if not self.frames:
+                    await asyncio.Event().wait()
+                if isinstance(frame := self.frames.pop(0), Exception):
+                    raise frame
+                return frame
+
+            async def close(self):
+                pass
+
+        async def open_socket():
+            if isinstance(connection := connections.pop(0), Exception):
+                raise connection
+            client.socket = Socket(connection)
+
+        async def login(reconnected=False):
+            logins.append((client.visit_secret, reconnected))
+
+        client.open_socket = open_socket
+        client.login = login
+        client.add_logs_listener(logs.append)
+        monkeypatch.setattr(asyncio, 'sleep', fake_sleep)
+        connection = asyncio.create_task(client.connect())
+        await client.wait_for(lambda: len(logins) == 2 and client.mods_sync, timeout=5)
+        monkeypatch.undo()
+        while len(logs) < 4:
+            await asyncio.sleep(0.01)
+
+        assert logins == [('s1', False), ('s2', True)]
+        assert delays[:2] == [1, 2]
+        assert sum('Skipped frame' in log for log in logs) == 2
+        assert 'Connection lost (reset)' in logs[2] and 'Connection lost (refused)' in logs[3]
+        connection.cancel()
+        await client.close()
+
+    asyncio.run(run())
+
+
+def test_catalog_cache_seeds_stale_catalogs_until_revalidated(tmp_path):
+    cache = CatalogCache(str(tmp_path / 'catalogs'))
+    cache.put('token', regions={'eu': 'Europe'}, versions=['1.1'], mods=[])
+    cache.persist()
+
+    client = FZClient('token')
+    cache = CatalogCache(str(tmp_path / 'catalogs'))
+    cache.track(client)
+    client.handlers['options']({'type': 'options', 'name': 'versions', 'options': ['1.2']})
+    client.seed(cache.get('token'))
+    assert client.regions == {'eu': 'Europe'} and client.versions == ['1.2']
+    assert client.stale == ('mods', 'regions') and not client.mods_sync
+
+    client.handlers['options']({'type': 'options', 'name': 'regions', 'options': {'us': 'America'}})
+    client.handlers['mods']({'type': 'mods', 'mods': []})
+    assert client.stale == () and client.mods_sync
+    cache.persist()
+    assert CatalogCache(str(tmp_path / 'catalogs')).get('token') == {
+        'regions': {'us': 'America'}, 'versions': ['1.2'], 'mods': []}
+    assert 'token' not in (tmp_path / 'catalogs').read_text()
+
+
+def test_kv_store_appends_merges_processes_and_migrates(tmp_path):
+    store_path = tmp_path / 'store'
+    store_path.write_text('{"userToken": "t", "region": "eu"}')
+    first = KeyValueStore(str(store_path))
+    assert first.get('userToken') == 't'
+    assert json.loads(store_path.read_text().splitlines()[0])['schema'] == 2
+
+    second = KeyValueStore(str(store_path))
+    first.set('region', 'us')
+    first.persist()
+    second.set('slot', 3)
+    second.persist()
+    assert second.get('region') == 'us'
+    size = store_path.stat().st_size
+    first.persist()
+    assert store_path.stat().st_size == size
+
+    with open(store_path, 'ab') as fp:
+        fp.write(b'{"k": "slot", "v"')
+    third = KeyValueStore(str(store_path))
+    assert (third.get('userToken'), third.get('region'), third.get('slot')) == ('t', 'us', 3)
+    third.set('version', '1.1')
+    third.persist()
+    assert KeyValueStore(str(store_path)).values == {'userToken': 't', 'region': 'us', 'slot': 3, 'version': '1.1'}
+
+    for i in range(300):
+        third.set('counter', i)
+        third.persist()
+    assert third.records < 100 and len(store_path.read_text().splitlines()) == third.records + 1
+    assert KeyValueStore(str(store_path)).get('counter') == 299
+
+
+def test_kv_store_reloads_journal_compacted_by_another_process(tmp_path):
+    store_path = str(tmp_path / 'store')
+    first, second = KeyValueStore(store_path), KeyValueStore(store_path)
+    first.set('z0', 'a')
+    first.persist()
+    os.link(store_path, store_path + '.inode')
+    for key in ('a1', 'a2'):
+        second.sync()
+        second.set(key, key * 50)
+        second.compact()
+    # Inode numbers are reused, bring the compacted journal back under the inode `first` last saw
+    with open(store_path, 'rb') as src, open(store_path + '.inode', 'r+b') as dst:
+        dst.write(src.read())
+    os.replace(store_path + '.inode', store_path)
+    first.set('z3', 'd')
+    first.persist()
+    assert first.values == KeyValueStore(store_path).values == {'z0': 'a', 'a1': 'a1' * 50, 'a2': 'a2' * 50, 'z3': 'd'}
+
+
+def test_capped_file_history_collapses_duplicates_and_compacts(tmp_path):
+    from prompt_toolkit.history import FileHistory
+
+    history_path = str(tmp_path / 'history')
+    legacy = FileHistory(history_path)
+    for i in range(50):
+        legacy.store_string(f'cmd {i % 10}')
+    legacy.store_string('multi\nline')
+
+    history = CappedFileHistory(history_path, max_entries=5)
+    assert history.latest() == 'multi\nline'
+    assert list(history.load_history_strings()) == ['multi\nline', 'cmd 9', 'cmd 8', 'cmd 7', 'cmd 6']
+    assert list(history.entries()) == ['multi\nline', 'cmd 9', 'cmd 8', 'cmd 7', 'cmd 6']
+
+    history.store_string('multi\nline')
+    history.store_string('cmd 7')
+    assert history.latest() == 'cmd 7' and len(list(history.entries())) == 6
+    for i in range(COMPACT_INTERVAL):
+        history.store_string(f'cmd {i}')
+    # Compacted to 5 entries before the last append
+    assert list(history.entries()) == [f'cmd {i}' for i in range(COMPACT_INTERVAL - 1, COMPACT_INTERVAL - 7, -1)]
+    assert list(FileHistory(history_path).load_history_strings())[0] == f'cmd {COMPACT_INTERVAL - 1}'
+
+
+def test_logs_queue_backpressure_policies():
+    async def fill(policy):
+        queue = LogsQueue(maxsize=2, policy=policy)
+        for i in range(5):
+            await queue.put(str(i))
+        return [queue.queue.get_nowait() for _ in range(queue.queue.qsize())], queue.dropped
+
+    assert asyncio.run(fill(Backpressure.DROP)) == (['0', '1'], 3)
+    assert asyncio.run(fill(Backpressure.COALESCE)) == (['0\n1\n2\n3\n4'], 0)
+
+
+def test_logs_index_rejects_duplicates_with_bounded_memory():
+    index = LogsIndex(window=8)
+    assert [index.add(n) for n in (5, 7, 6, 7, 5)] == [True, True, True, False, False]
+    assert index.watermark == 7 and not index.pending
+
+    assert index.add(9)
+    assert index.add(30)
+    assert 8 in index and not index.add(9)
+    assert index.watermark == 22 and index.pending == {30}
+
+    assert index.add(10 ** 12)
+    assert index.watermark == 10 ** 12 - 8 and index.pending == {10 ** 12}
+
+
+def test_logs_numbering_restarts_with_each_launch():
+    async def run():
+        client = FZClient()
+        logs = []
+        client.add_logs_listener(logs.append)
+        client.logs_task = asyncio.create_task(client.dispatch_logs())
+        frames = [{'type': 'running', 'launchId': 1}, *({'type': 'log', 'num': n, 'line': f'a{n}'} for n in (1, 2, 2)),
+                  {'type': 'idle'}, {'type': 'starting', 'launchId': 2},
+                  *({'type': 'log', 'num': n, 'line': f'b{n}'} for n in (1, 2))]
+        for data in frames:
+            if (result := client.handlers[data['type']](data)) is not None:
+                await result
+        for _ in range(100):
+            if len(logs) >= 4:
+                break
+            await asyncio.sleep(0.01)
+        await client.close()
+        return logs
+
+    assert asyncio.run(run()) == ['a1', 'a2', 'b1', 'b2']
+
+
+def test_ring_buffer_evicts_oldest_items():
+    ring = RingBuffer(3)
+    assert [ring.append(i) for i in range(5)] == [None, None, None, 0, 1]
+    assert list(ring) == [2, 3, 4]
+    assert (ring[0], ring[-1], len(ring)) == (2, 4, 3)
+
+
+def test_client_state_publishes_changes_and_versioned_snapshots():
+    client = FZClient()
+    changes = []
+    client.state.subscribe(changes.append, 'server_status')
+    before = client.state.snapshot()
+
+    client.on_running({'launchId': 7, 'socket': '1.2.3.4:34197'})
+    client.on_running({'launchId': 7, 'socket': '1.2.3.4:34197'})
+
+    assert [(c.key, c.old, c.new) for c in changes] == [('server_status', ServerStatus.OFFLINE, ServerStatus.RUNNING)]
+    after = client.state.snapshot()
+    assert after.version == before.version + 1
+    assert before.diff(after) == {
+        'running': (False, True),
+        'launch_id': (None, 7),
+        'server_address': (None, '1.2.3.4:34197'),
+        'server_status': (ServerStatus.OFFLINE, ServerStatus.RUNNING)
+    }
+
+
+def test_executor_runs_blocking_and_coroutine_functions():
+    async def double(n):
+        return n * 2
+
+    async def main():
+        pool = Executor(max_workers=1)
+        results = await asyncio.gather(pool.run(sum, [1, 2]), pool.run(double, 4))
+        await pool.shutdown()
+        return results
+
+    assert asyncio.run(main()) == [3, 8]
+
+
+def test_command_queue_reports_results_in_order(tmp_path):
+    script = tmp_path / 'runbook.txt'
+    script.write_text('# warm up\n/c game.print(1)\n\n/c game.print(2)\n/fail\n/c game.print(3)\n')
+    client = FZClient()
+    in_flight = []
+    peak = []
+
+    async def send_command(command):
+        in_flight.append(command)
+        peak.append(len(in_flight))
+        await asyncio.sleep(0.03 if command.endswith('(1)') else 0.01)
+        in_flight.remove(command)
+        if command == '/fail':
+            raise Exception('unknown command')
+
+    client.send_command = send_command
+    reported = []
+
+    async def main():
+        queue = CommandQueue(client, lambda c, latency, error: reported.append((c, error is None)), depth=2)
+        result = await queue.run_script(str(script))
+        queue.close()
+        return result
+
+    assert asyncio.run(main()) == (4, 1)
+    assert max(peak) == 2
+    assert reported == [('/c game.print(1)', True), ('/c game.print(2)', True),
+                        ('/fail', False), ('/c game.print(3)', True)]
+
+
+def test_log_archive_rotates_compresses_and_queries(tmp_path):
+    archive = LogArchive(str(tmp_path), segment_size=1024)
+    for i in range(200):
+        archive.append(f'line {i} player{i % 7}', launch_id=42, ts=1_700_000_000 + i)
+    archive.append('after restart', launch_id=43, ts=1_700_001_000)
+
+    assert len([p for p in (tmp_path / '42').iterdir() if p.name.endswith('.log.gz')]) > 1
+    assert len(list(archive.query(pattern='player3$'))) == 29
+    assert [line for _, line in archive.query(start=1_700_000_100, end=1_700_000_102)] == \
+           ['line 100 player2', 'line 101 player3', 'line 102 player4']
+    assert [line for _, line in archive.query(launch_id='43')] == ['after restart']
+    # Anchors apply to the message, in compressed segments, the open one and within a time range
+    assert len(list(archive.query(pattern='^line 1'))) == 111
+    assert [line for _, line in archive.query(pattern='^after')] == ['after restart']
+    assert [line for _, line in archive.query(start=1_700_000_100, end=1_700_000_102, pattern='^line 10[12] ')] == \
+           ['line 101 player3', 'line 102 player4']
+    assert list(archive.query(pattern='^17')) == []
+    # Matches spanning records in the mapped open segment are not lines
+    assert list(archive.query(pattern=r'restart\s')) == list(archive.query(pattern=r'player\d\s+\d+\tline')) == []
+    archive.close()
+
+
+def test_shell_reports_bad_patterns_and_scripts_as_logs(tmp_path):
+    shell = Shell(FZClient(), Storage(str(tmp_path)), LogArchive(str(tmp_path / 'archive')))
+    script_path = tmp_path / 'script.txt'
+    script_path.write_bytes(b'\xff\xfe/c game.print(1)')
+
+    asyncio.run(shell.search_archive(pattern='['))
+    asyncio.run(shell.run_script(str(script_path)))
+    errors = [line for line in shell.logs if 'Error:' in line]
+    assert 'unterminated character set' in errors[0] and "can't decode" in errors[1]
+
+
+def test_log_archive_close_compresses_queued_segments(tmp_path):
+    release = threading.Event()
+
+    async def run():
+        # Every worker busy, so the compressions of rotated segments stay queued
+        busy = [executor.submit(release.wait) for _ in range(executor.max_workers)]
+        archive = LogArchive(str(tmp_path), segment_size=256)
+        for i in range(40):
+            archive.append(f'line {i}', launch_id=7, ts=1_700_000_000 + i)
+        archive.close()
+        shutdown = asyncio.create_task(executor.shutdown())
+        await asyncio.sleep(0.1)
+        release.set()
+        await shutdown
+        await asyncio.gather(*busy)
+
+    asyncio.run(run())
+    logs = sorted(p.name for p in (tmp_path / '7').iterdir() if p.name.endswith('.log'))
+    assert len(logs) == 1 and len(list((tmp_path / '7').glob('*.log.gz'))) > 1
+
+
+def test_filtered_view_tracks_new_and_evicted_lines():
+    lines = RingBuffer(4)
+    view = FilteredView(lines, LogFilter('level:error player:bob'))
+    for line in ['[CHAT] bob: hi', Term.error('error', 'bob desynced'), Term.error('error', 'alice desynced'),
+                 Term.error('error', 'Bob timed out')]:
+        lines.append(line)
+        view.on_line_added()
+    assert list(view) == [Term.error('error', 'bob desynced'), Term.error('error', 'Bob timed out')]
+
+    for line in ['a', 'b', 'c']:
+        lines.append(line)
+        view.on_line_added()
+    assert list(view) == [Term.error('error', 'Bob timed out')]
+    assert LogFilter('/time[d]/ OUT').matches(Term.error('error', 'Bob timed out'))